@@ -18,6 +18,10 @@ setup(
         'minecraft_data == 0.3.1',
         'six',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+        'dns': ['dnspython'],
+    },
     keywords=['minecraft'],
     classifiers=[
         'License :: OSI Approved :: MIT License',
@@ -1,6 +1,7 @@
 import logging
 
 from spockbot.plugins.loader import PluginLoader as Client  # noqa
+from spockbot.plugins.runtime import Runtime  # noqa
 
 logger = logging.getLogger('spockbot')
 logger.setLevel(logging.INFO)
@@ -10,6 +10,11 @@ from spockbot.mcdata.utils import camel_case, find_by
 blocks = {}
 blocks_name = {}
 
+# Shared Block instances for every block id and metadata, indexed by the
+# 16 bit (id << 4) | meta block data stored in chunks. Unknown ids are None.
+# These are looked up on every collision test, don't modify them
+block_states = [None] * (1 << 16)
+
 # Used for extra logic outside of minecraft_data
 _block_exts = {}
 
@@ -25,6 +30,14 @@ def get_block(block, meta=None, init=True):
     return ret
 
 
+def get_block_state(block_id, meta=0):
+    """
+    Like get_block(block_id, meta), but returns the shared instance from
+    block_states instead of creating a new one
+    """
+    return block_states[(block_id << 4) | meta]
+
+
 class Block(object):
     id = -1
     display_name = 'Block'
@@ -96,11 +109,19 @@ def _make_block(block_dict):
     return cls
 
 
+def _update_block_states(block_ids):
+    for block_id in block_ids:
+        cls = blocks.get(block_id)
+        for meta in range(16):
+            block_states[(block_id << 4) | meta] = cls(meta) if cls else None
+
+
 def _create_blocks():
     for block in blocks_list:
         cls = _make_block(block)
         blocks[cls.id] = cls
         blocks_name[cls.name] = cls
+    _update_block_states(blocks)
 
 _create_blocks()
 
@@ -109,6 +130,7 @@ def block_ext(*block_ids):
     def inner(fn):
         for bid in block_ids:
             _block_exts[bid] = fn
+        _update_block_states(block_ids)
         return fn
 
     return inner
@@ -1,43 +1,100 @@
+"""
+A read cursor over a growable bytearray
+
+Bytes consumed by read() are only dropped by save(), and only once they make
+up the bulk of the storage, so decoding a burst of packets out of one buffer
+stays linear in the number of bytes received
+"""
+
+
 class BufferUnderflowException(Exception):
     pass
 
 
 class BoundBuffer(object):
-    buff = b''
-    cursor = 0
+    # Consumed bytes are kept around until there are at least this many of
+    # them and they outweigh the unread tail, compaction is then amortized
+    compact_size = 4096
 
     def __init__(self, data=b""):
-        self.write(data)
+        self.buff = bytearray(data)
+        self.base = 0
+        self.cursor = 0
 
     def read(self, length):
         if length > len(self):
             raise BufferUnderflowException()
 
-        out = self.buff[self.cursor:self.cursor+length]
+        out = bytes(self.buff[self.cursor:self.cursor+length])
+        self.cursor += length
+        return out
+
+    def read_view(self, length):
+        """
+        Like read(), but returns a memoryview into the buffer instead of a
+        copy. The view is only valid until the data is consumed, callers
+        that hold on to it should copy it with bytes()
+        """
+        if length > len(self):
+            raise BufferUnderflowException()
+
+        out = memoryview(self.buff)[self.cursor:self.cursor+length]
         self.cursor += length
         return out
 
+    def read_struct(self, fmt):
+        """
+        Unpack a precompiled struct.Struct straight out of the buffer
+        """
+        if fmt.size > len(self):
+            raise BufferUnderflowException()
+
+        out = fmt.unpack_from(self.buff, self.cursor)
+        self.cursor += fmt.size
+        return out
+
+    def unpack_from(self, decode, *args):
+        """
+        Decodes in place with decode(buff, offset, *args), which returns the
+        value and the offset past it, and moves the cursor there. decode
+        raises BufferUnderflowException when it runs past the end
+        """
+        out, self.cursor = decode(self.buff, self.cursor, *args)
+        return out
+
     def write(self, data):
-        self.buff += data
+        try:
+            self.buff += data
+        except BufferError:
+            # A view returned by read_view() is still alive, the bytearray
+            # can't be resized in place so copy it instead
+            self.buff = self.buff + data
 
     def flush(self):
         return self.read(len(self))
 
     def save(self):
-        self.buff = self.buff[self.cursor:]
-        self.cursor = 0
+        self.base = self.cursor
+        if self.base >= self.compact_size and \
+                self.base >= len(self.buff) - self.base:
+            try:
+                del self.buff[:self.base]
+            except BufferError:
+                self.buff = self.buff[self.base:]
+            self.base = self.cursor = 0
 
     def revert(self):
-        self.cursor = 0
+        self.cursor = self.base
 
     def tell(self):
-        return self.cursor
+        return self.cursor - self.base
 
     def __len__(self):
         return len(self.buff) - self.cursor
 
     def __repr__(self):
-        return "<BoundBuffer '%s'>" % repr(self.buff[self.cursor:])
+        return "<BoundBuffer '%s'>" % repr(bytes(self.buff[self.cursor:]))
 
     recv = read
+    recv_view = read_view
     append = write
@@ -0,0 +1,121 @@
+"""
+Packet layouts from proto.packet_structs compiled into decoders and encoders
+
+Runs of fixed-size fields are merged into a single precompiled struct.Struct
+so the common entity packets are unpacked in one call, everything else falls
+back to datautils. Variable parts not described by the layout are still
+handled by the packet's extension
+"""
+
+import functools
+from struct import Struct
+
+from spockbot.mcp import datautils, proto
+from spockbot.mcp.proto import MC_FP_BYTE, MC_FP_INT, MC_VARINT
+
+FP_SCALE = float(1 << 5)
+
+
+def _from_fixed_point(val):
+    return val / FP_SCALE
+
+
+def _to_fixed_point(val):
+    return int(val * FP_SCALE)
+
+
+# Fixed-size types that can be merged into a run
+# dtype -> (struct_suffix, decode_conversion, encode_conversion)
+fixed_types = {
+    dtype: (fmt, None, None)
+    for dtype, (fmt, size) in enumerate(proto.data_structs)
+}
+fixed_types[MC_FP_INT] = (
+    proto.data_structs[proto.MC_INT][0], _from_fixed_point, _to_fixed_point
+)
+fixed_types[MC_FP_BYTE] = (
+    proto.data_structs[proto.MC_BYTE][0], _from_fixed_point, _to_fixed_point
+)
+
+
+def _run_decoder(fmt, names, convs):
+    if not any(convs):
+        def decode(bbuff, data):
+            data.update(zip(names, bbuff.read_struct(fmt)))
+    else:
+        def decode(bbuff, data):
+            for name, conv, val in zip(names, convs, bbuff.read_struct(fmt)):
+                data[name] = conv(val) if conv else val
+    return decode
+
+
+def _run_encoder(fmt, names, convs):
+    if not any(convs):
+        def encode(data):
+            return fmt.pack(*[data[name] for name in names])
+    else:
+        def encode(data):
+            return fmt.pack(*[
+                conv(data[name]) if conv else data[name]
+                for name, conv in zip(names, convs)
+            ])
+    return encode
+
+
+def _field_decoder(dtype, name):
+    if dtype == MC_VARINT:
+        unpack = datautils.unpack_varint
+    else:
+        unpack = functools.partial(datautils.unpack, dtype)
+
+    def decode(bbuff, data):
+        data[name] = unpack(bbuff)
+    return decode
+
+
+def _field_encoder(dtype, name):
+    def encode(data):
+        return datautils.pack(dtype, data[name])
+    return encode
+
+
+class PacketCodec(object):
+    def __init__(self, fields):
+        self.decoders = []
+        self.encoders = []
+        run = []
+        for dtype, name in fields:
+            if dtype in fixed_types:
+                run.append((dtype, name))
+                continue
+            self._add_run(run)
+            run = []
+            self.decoders.append(_field_decoder(dtype, name))
+            self.encoders.append(_field_encoder(dtype, name))
+        self._add_run(run)
+
+    def _add_run(self, run):
+        if not run:
+            return
+        fmt = Struct(datautils.endian + ''.join(
+            fixed_types[dtype][0] for dtype, name in run
+        ))
+        names = tuple(name for dtype, name in run)
+        dec_convs = tuple(fixed_types[dtype][1] for dtype, name in run)
+        enc_convs = tuple(fixed_types[dtype][2] for dtype, name in run)
+        self.decoders.append(_run_decoder(fmt, names, dec_convs))
+        self.encoders.append(_run_encoder(fmt, names, enc_convs))
+
+    def decode(self, bbuff, data):
+        for decoder in self.decoders:
+            decoder(bbuff, data)
+        return data
+
+    def encode(self, data):
+        return b''.join([encoder(data) for encoder in self.encoders])
+
+
+hashed_codecs = {
+    ident: PacketCodec(fields)
+    for ident, fields in proto.hashed_structs.items()
+}
@@ -2,7 +2,7 @@ import json
 import struct
 
 from spockbot.mcp import nbt, proto
-from spockbot.mcp.bbuff import BoundBuffer
+from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
 from spockbot.mcp.proto import (MC_BYTE, MC_CHAT, MC_FLOAT, MC_FP_BYTE,
                                 MC_FP_INT, MC_INT, MC_LONG, MC_META,
                                 MC_POSITION, MC_SHORT, MC_SLOT, MC_STRING,
@@ -16,67 +16,92 @@ def byte_to_hex(byte_str):
 
 # Unpack/Pack functions return None on error
 
+# Encodings of the varints that fit in one byte
+varint_bytes = [struct.pack('B', i) for i in range(0x80)]
+pack_two_bytes = struct.Struct('BB').pack
+
+
+def decode_varint(buff, offset, bits=32):
+    """
+    Decodes a varint of at most bits bits out of a bytearray starting at
+    offset, returns the value and the offset past it. One and two byte
+    values, the bulk of them, are decoded without looping
+    """
+    try:
+        val = buff[offset]
+        if val < 0x80:
+            return val, offset + 1
+        total = val & 0x7F
+        val = buff[offset + 1]
+        if val < 0x80:
+            return total | (val << 7), offset + 2
+        total |= (val & 0x7F) << 7
+        shift = 14
+        offset += 2
+        while True:
+            val = buff[offset]
+            offset += 1
+            total |= (val & 0x7F) << shift
+            if val < 0x80:
+                break
+            shift += 7
+    except IndexError:
+        raise BufferUnderflowException()
+    if total >= (1 << bits):
+        return None, offset
+    if total & (1 << (bits - 1)):
+        total -= 1 << bits
+    return total, offset
+
+
+def decode_varints(buff, offset, count, bits=32):
+    """ Decodes count consecutive varints, see decode_varint() """
+    out = []
+    append = out.append
+    for _ in range(count):
+        val, offset = decode_varint(buff, offset, bits)
+        append(val)
+    return out, offset
+
+
+def encode_varint(val, bits=32):
+    if 0 <= val < 0x80:
+        return varint_bytes[val]
+    if val >= (1 << (bits - 1)) or val < -(1 << (bits - 1)):
+        return None
+    if val < 0:
+        val += 1 << bits
+    elif val < 0x4000:
+        return pack_two_bytes(0x80 | (val & 0x7F), val >> 7)
+    o = bytearray()
+    while val >= 0x80:
+        o.append(0x80 | (val & 0x7F))
+        val >>= 7
+    o.append(val)
+    return bytes(o)
+
+
 # Minecraft varints are 32-bit signed values
 # packed into Google Protobuf varints
 def unpack_varint(bbuff):
-    total = 0
-    shift = 0
-    val = 0x80
-    while val & 0x80:
-        val = struct.unpack('B', bbuff.read(1))[0]
-        total |= (val & 0x7F) << shift
-        shift += 7
-    if total >= (1 << 32):
-        return None
-    if total & (1 << 31):
-        total -= 1 << 32
-    return total
+    return bbuff.unpack_from(decode_varint)
+
+
+def unpack_varints(bbuff, count):
+    return bbuff.unpack_from(decode_varints, count)
 
 
 def pack_varint(val):
-    if val >= (1 << 31) or val < -(1 << 31):
-        return None
-    o = b''
-    if val < 0:
-        val += 1 << 32
-    while val >= 0x80:
-        bits = val & 0x7F
-        val >>= 7
-        o += struct.pack('B', (0x80 | bits))
-    bits = val & 0x7F
-    o += struct.pack('B', bits)
-    return o
+    return encode_varint(val)
 
 
 # Like a varint, but a 64-bit signed value
 def unpack_varlong(bbuff):
-    total = 0
-    shift = 0
-    val = 0x80
-    while val & 0x80:
-        val = struct.unpack('B', bbuff.read(1))[0]
-        total |= ((val & 0x7F) << shift)
-        shift += 7
-    if total >= 1 << 64:
-        return None
-    if total & (1 << 64):
-        total -= 1 << 64
-    return total
+    return bbuff.unpack_from(decode_varint, 64)
 
 
 def pack_varlong(val):
-    if val >= (1 << 63) or val < -(1 << 63):
-        return None
-    o = b''
-    if val < 0:
-        val += 1 << 64
-    while val >= 0x80:
-        bits = val & 0x7F
-        val >>= 7
-        o += struct.pack('B', (0x80 | bits))
-    bits = val & 0x7F
-    o += struct.pack('B', bits)
-    return o
+    return encode_varint(val, 64)
 
 
 # Three values packed into one 64-bit long
@@ -87,17 +87,14 @@ class ExtensionPSTC13:
     @staticmethod
     def decode_extra(packet, bbuff):
         count = datautils.unpack(MC_VARINT, bbuff)
-        packet.data['eids'] = [
-            datautils.unpack(MC_VARINT, bbuff) for i in range(count)
-            ]
+        packet.data['eids'] = datautils.unpack_varints(bbuff, count)
         return packet
 
     @staticmethod
     def encode_extra(packet):
-        o = datautils.pack(MC_VARINT, len(packet.data['eids']))
-        for eid in packet.data['eids']:
-            o += datautils.pack(MC_VARINT, eid)
-        return o
+        eids = packet.data['eids']
+        return b''.join([datautils.pack(MC_VARINT, len(eids))] +
+                        [datautils.pack_varint(eid) for eid in eids])
 
 
 # Play  SERVER_TO_CLIENT 0x20 Entity Properties
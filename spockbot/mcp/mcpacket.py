@@ -8,14 +8,20 @@ import logging
 import zlib
 from time import gmtime, strftime
 
+from six import PY2
+
 from spockbot.mcp import datautils, proto
 from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
+from spockbot.mcp.codec import hashed_codecs
 from spockbot.mcp.extensions import hashed_extensions
 from spockbot.mcp.proto import MC_VARINT
 
 
 logger = logging.getLogger('spockbot')
 
+# Largest uncompressed packet body the protocol allows
+MAX_BODY_LENGTH = 1 << 21
+
 
 class PacketDecodeFailure(Exception):
     def __init__(self, packet, pbuff, underflow=False):
@@ -24,6 +30,47 @@ class PacketDecodeFailure(Exception):
         self.underflow = underflow
 
 
+def decompress(data, length):
+    """
+    Inflates a compressed packet body, raises zlib.error if it doesn't come
+    out at exactly the declared length. Inflating stops at that length, so
+    a stream that would inflate to more is rejected without inflating it
+    """
+    if length > MAX_BODY_LENGTH:
+        raise zlib.error('Packet body of %d bytes is over the limit' % length)
+    if PY2 and isinstance(data, memoryview):
+        # Python 2 zlib doesn't take memoryviews
+        data = data.tobytes()
+    inflater = zlib.decompressobj()
+    body = inflater.decompress(data, length)
+    if inflater.unconsumed_tail or len(body) != length:
+        raise zlib.error('Packet body does not inflate to %d bytes' % length)
+    # flush() returns what is left of the stream, at most a few bytes as all
+    # of the input is consumed. Python 2 decompress objects have no eof
+    if not getattr(inflater, 'eof', False):
+        if inflater.flush() or not getattr(inflater, 'eof', True):
+            raise zlib.error('Packet body is not a %d byte stream' % length)
+    return body
+
+
+def read_body(bbuff, length, proto_comp_state):
+    """
+    Reads a packet of length bytes, without its length prefix, off bbuff and
+    returns the uncompressed body. Uncompressed bodies are returned as a view
+    into bbuff. Raises zlib.error if the body doesn't inflate
+    """
+    if proto_comp_state == proto.PROTO_COMP_ON:
+        start = bbuff.tell()
+        body_length = datautils.unpack(MC_VARINT, bbuff)
+        data = bbuff.recv_view(length - (bbuff.tell() - start))
+        if body_length > 0:
+            # Inflated straight out of the receive buffer, without copying
+            # the compressed data first
+            return decompress(data, body_length)
+        return data
+    return bbuff.recv_view(length)
+
+
 class Packet(object):
     def __init__(self,
                  ident=[proto.HANDSHAKE_STATE, proto.CLIENT_TO_SERVER, 0x00],
@@ -45,26 +92,27 @@ class Packet(object):
     def new_ident(self, ident):
         self.__init__(ident, self.data)
 
-    def decode(self, bbuff, proto_comp_state):
-        self.data = {}
+    def decode(self, bbuff, proto_comp_state, payload_filter=None):
         packet_length = datautils.unpack(MC_VARINT, bbuff)
-        packet_data = bbuff.recv(packet_length)
-        pbuff = BoundBuffer(packet_data)
-        if proto_comp_state == proto.PROTO_COMP_ON:
-            body_length = datautils.unpack(MC_VARINT, pbuff)
-            if body_length > 0:
-                body_data = zlib.decompress(pbuff.flush(), zlib.MAX_WBITS)
-                pbuff.write(body_data)
-                pbuff.save()
+        try:
+            body = read_body(bbuff, packet_length, proto_comp_state)
+        except zlib.error:
+            raise PacketDecodeFailure(self, bbuff)
+        return self.decode_body(BoundBuffer(body), payload_filter)
 
+    def decode_body(self, pbuff, payload_filter=None):
+        # payload_filter is called once the ident is known, if it returns
+        # False the payload is skipped and None is returned
+        self.data = {}
         try:
             # Ident
             self.__ident[2] = datautils.unpack(MC_VARINT, pbuff)
             self.ident = tuple(self.__ident)
             self.str_ident = proto.packet_ident2str[self.ident]
+            if payload_filter is not None and not payload_filter(self):
+                return None
             # Payload
-            for dtype, name in proto.hashed_structs[self.ident]:
-                self.data[name] = datautils.unpack(dtype, pbuff)
+            hashed_codecs[self.ident].decode(pbuff, self.data)
             # Extension
             if self.ident in hashed_extensions:
                 hashed_extensions[self.ident].decode_extra(self, pbuff)
@@ -78,8 +126,7 @@ class Packet(object):
         # Ident
         o = datautils.pack(MC_VARINT, self.ident[2])
         # Payload
-        for dtype, name in proto.hashed_structs[self.ident]:
-            o += datautils.pack(dtype, self.data[name])
+        o += hashed_codecs[self.ident].encode(self.data)
         # Extension
         if self.ident in hashed_extensions:
             o += hashed_extensions[self.ident].encode_extra(self)
@@ -9,9 +9,13 @@ except NameError:
     basestring = str  # compatibility for Python 3
     unicode = str  # compatibility for Python 3
 
+import sys
+from array import array
 from collections import MutableMapping, MutableSequence, Sequence
 from struct import Struct, error as struct_error
 
+from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
+
 TAG_END = 0
 TAG_BYTE = 1
 TAG_SHORT = 2
@@ -31,6 +35,72 @@ class MalformedFileError(Exception):
     pass
 
 
+# Payload sizes of the fixed-size tags, for skipping over them
+_fixed_sizes = {
+    TAG_BYTE: 1,
+    TAG_SHORT: 2,
+    TAG_INT: 4,
+    TAG_LONG: 8,
+    TAG_FLOAT: 4,
+    TAG_DOUBLE: 8,
+}
+_length_fmt = Struct(">i")
+_string_length_fmt = Struct(">H")
+
+
+def _skip_payload(buff, offset, tag_id):
+    """
+    Returns the offset past the payload of a tag_id tag that starts at
+    offset in buff, without decoding it
+    """
+    size = _fixed_sizes.get(tag_id)
+    if size is not None:
+        return offset + size
+    if tag_id == TAG_STRING:
+        return offset + 2 + _string_length_fmt.unpack_from(buff, offset)[0]
+    if tag_id in (TAG_BYTE_ARRAY, TAG_INT_ARRAY, TAG_LIST):
+        if tag_id == TAG_LIST:
+            tag_id = buff[offset]
+            offset += 1
+        length = _length_fmt.unpack_from(buff, offset)[0]
+        offset += 4
+        if length < 0:
+            raise MalformedFileError("Negative length %d" % length)
+        if tag_id == TAG_BYTE_ARRAY:
+            return offset + length
+        if tag_id == TAG_INT_ARRAY:
+            return offset + 4 * length
+        size = _fixed_sizes.get(tag_id)
+        if size is not None:
+            return offset + size * length
+        for _ in range(length):
+            offset = _skip_payload(buff, offset, tag_id)
+        return offset
+    if tag_id == TAG_COMPOUND:
+        while True:
+            tag_id = buff[offset]
+            offset += 1
+            if tag_id == TAG_END:
+                return offset
+            offset += 2 + _string_length_fmt.unpack_from(buff, offset)[0]
+            offset = _skip_payload(buff, offset, tag_id)
+    raise ValueError("Unrecognised tag type")
+
+
+def _scan_compound(buff, offset):
+    """
+    BoundBuffer.unpack_from() decoder, returns the raw payload of the
+    compound at offset, up to and including its TAG_END
+    """
+    try:
+        end = _skip_payload(buff, offset, TAG_COMPOUND)
+    except (IndexError, struct_error):
+        raise BufferUnderflowException()
+    if end > len(buff):
+        raise BufferUnderflowException()
+    return bytes(buff[offset:end]), end
+
+
 class Tag(object):
     """Tag, a variable with an intrinsic name."""
     id = None
@@ -237,9 +307,11 @@ class TagIntArray(Tag, MutableSequence):
 
     # Parsers and Generators
     def _parse_buffer(self, buffer):
+        # Decoded in bulk into an array('i') rather than a list of ints
         length = TagInt(buffer=buffer).value
-        self.update_fmt(length)
-        self.value = list(self.fmt.unpack(buffer.read(self.fmt.size)))
+        self.value = array('i', buffer.read(4 * length))
+        if sys.byteorder == 'little':
+            self.value.byteswap()
 
     def _render_buffer(self, buffer):
         length = len(self.value)
@@ -416,8 +488,29 @@ class TagCompound(Tag, MutableMapping):
         if buffer:
             self._parse_buffer(buffer)
 
+    @property
+    def tags(self):
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._tags = []
+            self._parse_tags(BoundBuffer(raw))
+        return self._tags
+
+    @tags.setter
+    def tags(self, tags):
+        self._raw = None
+        self._tags = tags
+
     # Parsers and Generators
     def _parse_buffer(self, buffer):
+        # Out of a BoundBuffer the payload is only scanned for its end, the
+        # tags are parsed on first access. Until then it renders as is
+        if isinstance(buffer, BoundBuffer):
+            self._raw = buffer.unpack_from(_scan_compound)
+        else:
+            self._parse_tags(buffer)
+
+    def _parse_tags(self, buffer):
         while True:
             type = TagByte(buffer=buffer)
             if type.value == TAG_END:
@@ -433,6 +526,9 @@ class TagCompound(Tag, MutableMapping):
                     raise ValueError("Unrecognised tag type")
 
     def _render_buffer(self, buffer):
+        if self._raw is not None:
+            buffer.write(self._raw)
+            return
         for tag in self.tags:
             TagByte(tag.id)._render_buffer(buffer)
             TagString(tag.name)._render_buffer(buffer)
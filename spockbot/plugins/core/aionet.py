@@ -0,0 +1,238 @@
+"""
+Runs clients on an asyncio event loop, for embedding SpockBot in asyncio
+applications
+
+The AsyncioRuntime ticks the event cores of its clients from loop callbacks:
+a round runs when data arrives and otherwise when the earliest timer of any
+client is due, scheduled with loop.call_later(), so nothing busy polls. The
+AsyncioNetPlugin takes the place of the NetPlugin and connects through an
+asyncio Protocol that feeds NetCore.read_packet() from data_received()::
+
+    runtime = AsyncioRuntime(loop)
+    client = Client(runtime=runtime, plugins=asyncio_plugins())
+    client.start(host, port)
+    # Resolves once every client has shut down
+    yield from runtime.closed
+
+Signals are left to the application, call runtime.kill() to stop all clients.
+Needs Python 3.4 or later
+"""
+import logging
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from spockbot.plugins import default_plugins
+from spockbot.plugins.base import pl_announce
+from spockbot.plugins.core.net import NetCore, NetPlugin
+from spockbot.plugins.runtime import Runtime
+
+logger = logging.getLogger('spockbot')
+
+# The module can still be imported without asyncio, it just can't be used
+BaseProtocol = asyncio.Protocol if asyncio is not None else object
+
+
+class AsyncioRuntime(Runtime):
+    def __init__(self, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.round_handle = None
+        self.round_soon = False
+        self.closed = asyncio.Future(loop=self.loop)
+        super(AsyncioRuntime, self).__init__()
+
+    def make_poller(self, poller):
+        # Sockets are handled by the asyncio loop, see AsyncioNetPlugin
+        return None
+
+    def reg_signals(self):
+        pass
+
+    def add_event_core(self, event):
+        if self.closed.done():
+            self.closed = asyncio.Future(loop=self.loop)
+        super(AsyncioRuntime, self).add_event_core(event)
+        self.wake()
+
+    def wake(self):
+        """ Run a round on the next loop iteration """
+        if self.round_soon:
+            return
+        if self.round_handle is not None:
+            self.round_handle.cancel()
+        self.round_soon = True
+        self.round_handle = self.loop.call_soon(self.tick)
+
+    def tick(self):
+        self.round_handle = None
+        self.round_soon = False
+        if not self.run_round():
+            logger.debug('RUNTIME: All clients shut down')
+            if not self.closed.done():
+                self.closed.set_result(None)
+            return
+        timeout = self.get_timeout()
+        if timeout >= 0:
+            self.round_handle = self.loop.call_later(timeout, self.tick)
+
+    def run(self):
+        self.loop.run_until_complete(self.closed)
+
+    def kill(self, *args):
+        super(AsyncioRuntime, self).kill()
+        self.wake()
+
+
+class TransportSocket(object):
+    """
+    Stands in for the SelectSocket, data pushed to the NetCore is written to
+    the transport once per loop iteration. While the transport's own buffer
+    is full data stays in the NetCore send queue
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.transport = None
+        self.connecting = None
+        self.net = None
+        self.paused = False
+        self._sending = False
+
+    @property
+    def sending(self):
+        return self._sending
+
+    @sending.setter
+    def sending(self, value):
+        if value and not self._sending:
+            self.loop.call_soon(self.flush)
+        self._sending = value
+
+    def flush(self):
+        self._sending = False
+        if self.transport is not None and not self.paused \
+                and self.net.queued:
+            self.transport.writelines(self.net.send_queue)
+            self.net.consume(self.net.queued)
+
+    def shutdown(self, how):
+        if self.transport is not None and self.transport.can_write_eof():
+            self.flush()
+            self.transport.write_eof()
+
+    def close(self):
+        # Gives up on a connect that is still running
+        if self.connecting is not None:
+            self.connecting.cancel()
+            self.connecting = None
+        if self.transport is not None:
+            self.flush()
+            self.transport.close()
+            self.transport = None
+
+
+class NetProtocol(BaseProtocol):
+    def __init__(self, net, sock):
+        self.net = net
+        self.sock = sock
+
+    def connection_made(self, transport):
+        # The client reset or shut down while connecting
+        if self.net.sock is not self.sock or self.net.event.kill_event:
+            transport.close()
+            return
+        self.sock.transport = transport
+        self.sock.connecting = None
+        self.net.connecting = False
+        self.net.connected = True
+        self.net.event.emit('net_connect', (self.net.host, self.net.port))
+        logger.debug("NETCORE: Connected to host: %s port: %s",
+                     self.net.host, self.net.port)
+        self.sock.flush()
+        self.net.runtime.wake()
+
+    def data_received(self, data):
+        if self.sock.transport is not None:
+            self.net.read_packet(data)
+            self.net.runtime.wake()
+
+    def pause_writing(self):
+        self.sock.paused = True
+
+    def resume_writing(self):
+        self.sock.paused = False
+        self.sock.flush()
+
+    def connection_lost(self, exc):
+        # Closed by us, the plugin has already cleaned up
+        if self.sock.transport is None:
+            return
+        self.sock.transport = None
+        if exc is None:
+            self.net.event.emit('SOCKET_HUP')
+        else:
+            self.net.event.emit('SOCKET_ERR', exc)
+        self.net.runtime.wake()
+
+
+class AsyncioNetCore(NetCore):
+    def __init__(self, runtime, *args, **kwargs):
+        self.runtime = runtime
+        super(AsyncioNetCore, self).__init__(*args, **kwargs)
+
+    def reset(self, sock):
+        super(AsyncioNetCore, self).reset(sock)
+        sock.net = self
+
+    def connect(self, host='localhost', port=25565):
+        self.host = host
+        self.port = port
+        self.connecting = True
+        logger.debug("NETCORE: Attempting to connect to host: %s port: %s",
+                     host, port)
+        # Resolved by the loop, the Resolver isn't needed
+        self.event.emit('net_connecting', (host, port))
+        protocol = NetProtocol(self, self.sock)
+        loop = self.runtime.loop
+        connecting = loop.create_task(
+            loop.create_connection(lambda: protocol, host, port)
+        )
+        connecting.add_done_callback(self.connect_done)
+        self.sock.connecting = connecting
+
+    def connect_done(self, connecting):
+        if connecting.cancelled() or connecting.exception() is None:
+            return
+        self.connect_failed(connecting.exception())
+        self.runtime.wake()
+
+
+@pl_announce('Net')
+class AsyncioNetPlugin(NetPlugin):
+    """ NetPlugin on an asyncio transport, needs an AsyncioRuntime """
+
+    def make_sock(self):
+        return TransportSocket(self.runtime.loop)
+
+    def make_net(self):
+        return AsyncioNetCore(self.runtime, self.sock, self.event,
+                              self.settings['lazy_decode'],
+                              self.settings['send_high_water'],
+                              self.settings['comp_level'],
+                              self.settings['comp_threshold'])
+
+    def handle_connect(self, name, data):
+        # The protocol hands data to the NetCore itself
+        self.stop_connect_timers()
+
+    def close_sock(self):
+        self.stop_connect_timers()
+        self.sock.close()
+
+
+def asyncio_plugins(plugins=default_plugins):
+    """ The plugin list with the NetPlugin swapped for the AsyncioNetPlugin """
+    return [(name, AsyncioNetPlugin if plugin is NetPlugin else plugin)
+            for name, plugin in plugins]
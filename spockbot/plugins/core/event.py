@@ -13,13 +13,23 @@ logger = logging.getLogger('spockbot')
 
 
 class EventCore(object):
-    def __init__(self):
+    def __init__(self, runtime=None):
         self.kill_event = False
         self.event_handlers = defaultdict(list)
-        signal.signal(signal.SIGINT, self.kill)
-        signal.signal(signal.SIGTERM, self.kill)
+        # event: tuple of (handler, copy_data) in the order they're run
+        self.handler_cache = {}
+        # A shared Runtime handles signals and runs the loop for all of its
+        # clients
+        self.runtime = runtime
+        if runtime is None:
+            signal.signal(signal.SIGINT, self.kill)
+            signal.signal(signal.SIGTERM, self.kill)
 
     def event_loop(self):
+        if self.runtime is not None:
+            # Returns right away, the client runs once runtime.run() is called
+            self.runtime.add_event_core(self)
+            return
         self.emit('event_start')
         while not self.kill_event:
             self.emit('event_tick')
@@ -28,19 +38,39 @@ class EventCore(object):
 
     def reg_event_handler(self, event, handler):
         self.event_handlers[event].append(handler)
+        self.handler_cache.pop(event, None)
+
+    def unreg_event_handler(self, event, handler):
+        self.event_handlers[event].remove(handler)
+        self.handler_cache.pop(event, None)
+
+    def get_handlers(self, event):
+        # Newest handlers run first. emit iterates this snapshot, so
+        # handlers that register themselves for the same event they
+        # handle aren't run until the next emit, which would otherwise
+        # create an infinite loop
+        handlers = tuple(
+            (handler, getattr(handler, 'copy_event_data', False))
+            for handler in reversed(self.event_handlers.get(event, ()))
+        )
+        self.handler_cache[event] = handlers
+        return handlers
 
     def emit(self, event, data=None):
+        handlers = self.handler_cache.get(event)
+        if handlers is None:
+            handlers = self.get_handlers(event)
         to_remove = []
-        # reversed, because handlers can register themselves
-        # for the same event they handle, and the new handler
-        # is appended to the end of the iterated handler list
-        # and immediately run, so an infinite loop can be created
-        for handler in reversed(self.event_handlers[event]):
-            d = data.clone() if hasattr(data, 'clone') else copy.deepcopy(data)
+        for handler, copy_data in handlers:
+            if copy_data:
+                d = data.clone() if hasattr(data, 'clone') \
+                    else copy.deepcopy(data)
+            else:
+                d = data
             if handler(event, d) == EVENT_UNREGISTER:
                 to_remove.append(handler)
         for handler in to_remove:
-            self.event_handlers[event].remove(handler)
+            self.unreg_event_handler(event, handler)
 
     def kill(self, *args):
         self.kill_event = True
@@ -49,4 +79,5 @@ class EventCore(object):
 @pl_announce('Event')
 class EventPlugin(object):
     def __init__(self, ploader, settings):
-        ploader.provides('Event', EventCore())
+        runtime = getattr(ploader, 'runtime', None)
+        ploader.provides('Event', EventCore(runtime))
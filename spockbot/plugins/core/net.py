@@ -4,22 +4,48 @@ servers and processing incoming packet data.
 Coordinates with the Timers plugin to honor wall-clock timers
 """
 
+import collections
+import errno
+import itertools
 import logging
+import os
 import select
 import socket
+import threading
 import time
+import zlib
+
+try:
+    import selectors
+except ImportError:
+    selectors = None
+
+try:
+    import dns.resolver
+except ImportError:
+    dns = None
 
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import ciphers
 from cryptography.hazmat.primitives.ciphers import algorithms, modes
 
-from spockbot.mcp import mcpacket, proto
+from six.moves.queue import Empty, Full, Queue
+
+from spockbot.mcp import datautils, mcpacket, proto
 from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
+from spockbot.mcp.proto import MC_VARINT
 from spockbot.plugins.base import PluginBase, pl_announce
 
 logger = logging.getLogger('spockbot')
 backend = default_backend()
 
+# Spare bytes update_into() wants past the data it decrypts, one AES block
+# minus one
+CIPHER_PAD = 15
+
+# recv_into() errors of a socket that has been drained
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
 
 class AESCipher(object):
     def __init__(self, shared_secret):
@@ -35,71 +61,438 @@ class AESCipher(object):
     def decrypt(self, data):
         return self.decryptifier.update(data)
 
+    def decrypt_into(self, view, size):
+        """
+        Decrypts the first size bytes of view in place, the view must be at
+        least CIPHER_PAD bytes longer than that
+        """
+        if hasattr(self.decryptifier, 'update_into'):
+            self.decryptifier.update_into(view[:size], view)
+        else:
+            view[:size] = self.decryptifier.update(view[:size].tobytes())
+
 
 class SelectSocket(socket.socket):
     """
-    Provides an asynchronous socket with a poll method built on
-    top of select.select for cross-platform compatiability
+    The client socket, polled by one of the pollers below. Setting sending
+    asks the poller to report when the socket is ready for writing
     """
     def __init__(self, timer):
         super(SelectSocket, self).__init__(socket.AF_INET, socket.SOCK_STREAM)
-        self.sending = False
+        self._sending = False
+        self.poller = None
         self.timer = timer
 
-    def poll(self):
-        flags = []
-        if self.sending:
-            self.sending = False
-            slist = [(self,), (self,), (self,)]
-        else:
-            slist = [(self,), (), (self,)]
-        timeout = self.timer.get_timeout()
+    @property
+    def sending(self):
+        return self._sending
+
+    @sending.setter
+    def sending(self, value):
+        if value != self._sending:
+            self._sending = value
+            if self.poller is not None:
+                self.poller.set_sending(self, value)
+
+
+class SelectPoller(object):
+    """
+    select.select over any number of SelectSockets, for platforms without
+    the selectors module. Ready sockets get their callbacks called directly
+    with the flag name, like event handlers. Sockets registered without
+    on_recv are only watched while sending
+    """
+    def __init__(self):
+        self.socks = {}
+
+    def register(self, sock, on_recv, on_send, on_err):
+        sock.poller = self
+        self.socks[sock] = on_recv, on_send, on_err
+
+    def unregister(self, sock):
+        if self.socks.pop(sock, None) is not None:
+            sock.poller = None
+
+    def set_sending(self, sock, sending):
+        pass
+
+    def poll(self, timeout=-1):
+        if not self.socks:
+            time.sleep(timeout if timeout >= 0 else 1)
+            return
+        xlist = list(self.socks)
+        rlist = [sock for sock in xlist if self.socks[sock][0] is not None]
+        wlist = [sock for sock in xlist if sock.sending]
+        slist = [rlist, wlist, xlist]
         if timeout >= 0:
             slist.append(timeout)
         try:
             rlist, wlist, xlist = select.select(*slist)
         except select.error as e:
-            logger.error("SELECTSOCKET: Socket Error: %s", str(e))
-            rlist, wlist, xlist = [], [], []
-        if rlist:
-            flags.append('SOCKET_RECV')
-        if wlist:
-            flags.append('SOCKET_SEND')
-        if xlist:
-            flags.append('SOCKET_ERR')
-        return flags
+            logger.error("SELECTPOLLER: Socket Error: %s", str(e))
+            return
+        for sock in wlist:
+            sock.sending = False
+        for i, flag, socks in ((0, 'SOCKET_RECV', rlist),
+                               (1, 'SOCKET_SEND', wlist),
+                               (2, 'SOCKET_ERR', xlist)):
+            for sock in socks:
+                # Callbacks of an earlier flag may have dropped the socket
+                if sock.poller is self:
+                    self.socks[sock][i](flag, None)
+
+
+class SelectorsPoller(object):
+    """
+    Poller on selectors.DefaultSelector, epoll or kqueue where available
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.socks = {}
+
+    def get_events(self, sock):
+        events = selectors.EVENT_WRITE if sock.sending else 0
+        if self.socks[sock][0] is not None:
+            events |= selectors.EVENT_READ
+        return events
+
+    def register(self, sock, on_recv, on_send, on_err):
+        sock.poller = self
+        self.socks[sock] = on_recv, on_send, on_err
+        self.set_sending(sock, sock.sending)
+
+    def unregister(self, sock):
+        if sock.poller is self:
+            sock.poller = None
+            del self.socks[sock]
+            if sock in self.selector.get_map():
+                self.selector.unregister(sock)
+
+    def set_sending(self, sock, sending):
+        # Write only sockets leave the selector while there's nothing to send
+        events = self.get_events(sock)
+        registered = sock in self.selector.get_map()
+        if not events:
+            if registered:
+                self.selector.unregister(sock)
+        elif registered:
+            self.selector.modify(sock, events, self.socks[sock])
+        else:
+            self.selector.register(sock, events, self.socks[sock])
+
+    def poll(self, timeout=-1):
+        if not self.socks:
+            time.sleep(timeout if timeout >= 0 else 1)
+            return
+        try:
+            ready = self.selector.select(timeout if timeout >= 0 else None)
+        except select.error as e:
+            logger.error("SELECTORSPOLLER: Socket Error: %s", str(e))
+            return
+        for key, mask in ready:
+            sock = key.fileobj
+            on_recv, on_send, on_err = key.data
+            # Callbacks may have dropped any of the ready sockets
+            if mask & selectors.EVENT_READ and sock.poller is self:
+                on_recv('SOCKET_RECV', None)
+            if mask & selectors.EVENT_WRITE and sock.poller is self:
+                sock.sending = False
+                on_send('SOCKET_SEND', None)
+
+
+class Waker(object):
+    """
+    A socket pair the pollers can watch, so other threads can cut a poll
+    short. wake() writes at most one byte until the poll side clear()s it
+    """
+    sending = False
 
+    def __init__(self):
+        self.poller = None
+        self.woken = False
+        self.rsock, self.wsock = socket.socketpair()
+        self.rsock.setblocking(False)
+        self.wsock.setblocking(False)
 
-class NetCore(object):
-    def __init__(self, sock, event):
+    def fileno(self):
+        return self.rsock.fileno()
+
+    def wake(self):
+        if not self.woken:
+            self.woken = True
+            try:
+                self.wsock.send(b'\0')
+            except socket.error:
+                # Full, the poll side hasn't caught up yet anyway
+                pass
+
+    def clear(self):
+        try:
+            while self.rsock.recv(4096):
+                pass
+        except socket.error:
+            pass
+        # Only after draining, a wake() in between would otherwise be lost
+        self.woken = False
+
+    def close(self):
+        self.rsock.close()
+        self.wsock.close()
+
+
+class ReaderThread(threading.Thread):
+    """
+    Receives, decrypts, splits and inflates packets away from the event
+    loop, see the reader_thread setting of the NetPlugin. Bodies are queued
+    for NetCore.read_bodies() and the waker tells the loop they're there.
+    zlib and cryptography release the GIL while they work
+    """
+    def __init__(self, net, sock, waker, bufsize=4096, queue_size=256):
+        super(ReaderThread, self).__init__()
+        self.daemon = True
+        self.net = net
         self.sock = sock
+        self.waker = waker
+        self.bufsize = bufsize
+        # ('body', (pbuff, raw)) items, or SOCKET_HUP or SOCKET_ERR and
+        # their data. Reading stops while it's full
+        self.bodies = Queue(queue_size)
+        self.stopper = Waker()
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        self.stopper.wake()
+
+    def put(self, item):
+        while self.running:
+            try:
+                self.bodies.put(item, timeout=0.1)
+            except Full:
+                continue
+            self.waker.wake()
+            return
+
+    def wait(self, selector):
+        if selector is None:
+            return select.select([self.sock, self.stopper], [], [])[0]
+        return [key.fileobj for key, _ in selector.select()]
+
+    def run(self):
+        rbuff = BoundBuffer()
+        view = memoryview(bytearray(self.bufsize + CIPHER_PAD))
+        # select() can't take fds at or over FD_SETSIZE, which a Runtime
+        # running many clients gets to
+        selector = None
+        try:
+            if selectors is not None:
+                selector = selectors.DefaultSelector()
+                selector.register(self.sock, selectors.EVENT_READ)
+                selector.register(self.stopper, selectors.EVENT_READ)
+            while self.running:
+                ready = self.wait(selector)
+                if self.stopper in ready:
+                    break
+                try:
+                    size = self.sock.recv_into(view, len(view) - CIPHER_PAD)
+                except socket.error as error:
+                    if error.errno in WOULD_BLOCK:
+                        continue
+                    raise
+                if not size:
+                    self.put(('SOCKET_HUP', None))
+                    break
+                if self.net.encrypted:
+                    self.net.cipher.decrypt_into(view, size)
+                rbuff.write(view[:size])
+                self.split(rbuff)
+        except Exception as error:
+            # Whatever failed, the loop has to hear the connection is no
+            # longer read
+            self.put(('SOCKET_ERR', error))
+        finally:
+            if selector is not None:
+                selector.close()
+            self.stopper.close()
+
+    def split(self, rbuff):
+        while rbuff:
+            rbuff.save()
+            # Only the loop thread changes the state, from off to on, bodies
+            # split before it does are tagged raw
+            comp_state = self.net.comp_state
+            try:
+                length = datautils.unpack(MC_VARINT, rbuff)
+                try:
+                    body = mcpacket.read_body(rbuff, length, comp_state)
+                    raw = comp_state == proto.PROTO_COMP_OFF
+                except zlib.error:
+                    # Left to the loop thread to fail on and report
+                    rbuff.revert()
+                    length = datautils.unpack(MC_VARINT, rbuff)
+                    body = rbuff.recv_view(length)
+                    raw = True
+            except BufferUnderflowException:
+                rbuff.revert()
+                break
+            self.put(('body', (BoundBuffer(body), raw)))
+
+
+def get_poller(name=None):
+    """
+    Create a poller by name, 'select' or 'selectors'. None picks selectors
+    when available
+    """
+    if name is None:
+        name = 'select' if selectors is None else 'selectors'
+    return pollers[name]()
+
+
+pollers = {
+    'select': SelectPoller,
+    'selectors': SelectorsPoller,
+}
+
+
+# Most buffers handed to one sendmsg() call, the common IOV_MAX
+IOV_MAX = 1024
+
+# connect_ex() results of a connect that is still in progress
+CONNECT_PENDING = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                   getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK))
+
+
+class Resolver(object):
+    """
+    Looks up the address of a server on a background thread, done is set
+    once addr or error is. The _minecraft._tcp SRV record is tried first if
+    dnspython is installed and the port wasn't changed from the default
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.addr = None
+        self.error = None
+        self.done = False
+        try:
+            # IP addresses don't need a lookup
+            self.addr = socket.getaddrinfo(
+                host, port, socket.AF_INET, socket.SOCK_STREAM, 0,
+                socket.AI_NUMERICHOST
+            )[0][4]
+            self.done = True
+        except socket.error:
+            thread = threading.Thread(target=self.resolve)
+            thread.daemon = True
+            thread.start()
+
+    def resolve(self):
+        host, port = self.host, self.port
+        if dns is not None and port == 25565:
+            try:
+                record = dns.resolver.query('_minecraft._tcp.' + host,
+                                            'SRV')[0]
+                host = record.target.to_text(omit_final_dot=True)
+                port = record.port
+            except dns.exception.DNSException:
+                pass
+        try:
+            self.addr = socket.getaddrinfo(
+                host, port, socket.AF_INET, socket.SOCK_STREAM
+            )[0][4]
+        except socket.error as error:
+            self.error = error
+        self.done = True
+
+
+class NetCore(object):
+    def __init__(self, sock, event, lazy_decode=False, high_water=0,
+                 comp_level=6, comp_threshold=-1):
         self.event = event
+        self.lazy_decode = lazy_decode
+        # net_high_water is emitted once more than high_water bytes are
+        # queued for sending, net_low_water once the queue is back down to a
+        # quarter of that. 0 turns both off
+        self.high_water = high_water
+        # zlib level and smallest size of compressed outgoing packets, the
+        # server's threshold is used if it is higher
+        self.comp_level = comp_level
+        self.send_comp_threshold = comp_threshold
+        self.reset(sock)
+
+    def reset(self, sock):
+        """
+        Starts over with a new socket, the settings above are kept
+        """
+        self.sock = sock
+        self.above_high_water = False
         self.host = None
         self.port = None
+        self.connecting = False
+        self.resolver = None
         self.connected = False
         self.encrypted = False
         self.proto_state = proto.HANDSHAKE_STATE
         self.comp_state = proto.PROTO_COMP_OFF
         self.comp_threshold = -1
-        self.sbuff = b''
+        # Encoded packets waiting for the socket, written out together
+        # once it's writable
+        self.send_queue = collections.deque()
+        self.queued = 0
         self.rbuff = BoundBuffer()
 
     def connect(self, host='localhost', port=25565):
+        """
+        Starts connecting without blocking, the address is resolved and the
+        socket connected while the event loop runs. net_connect is emitted
+        once connected, SOCKET_ERR if that fails
+        """
         self.host = host
         self.port = port
-        try:
-            logger.debug("NETCORE: Attempting to connect to host: %s port: %s",
-                         host, port)
-            # Set the connect to be a blocking operation
-            self.sock.setblocking(True)
-            self.sock.connect((self.host, self.port))
-            self.sock.setblocking(False)
-            self.connected = True
-            self.event.emit('net_connect', (self.host, self.port))
-            logger.debug("NETCORE: Connected to host: %s port: %s", host, port)
-        except socket.error as error:
-            logger.error("NETCORE: Error on Connect")
-            self.event.emit('SOCKET_ERR', error)
+        self.connecting = True
+        logger.debug("NETCORE: Attempting to connect to host: %s port: %s",
+                     host, port)
+        self.resolver = Resolver(host, port)
+        self.event.emit('net_connecting', (host, port))
+
+    def check_resolver(self):
+        """
+        Starts the TCP connect once the address has been resolved, returns
+        False while the lookup is still running
+        """
+        if self.resolver is None:
+            return True
+        if not self.resolver.done:
+            return False
+        resolver, self.resolver = self.resolver, None
+        if resolver.error is not None:
+            self.connect_failed(resolver.error)
+            return True
+        self.sock.setblocking(False)
+        err = self.sock.connect_ex(resolver.addr)
+        if err in CONNECT_PENDING:
+            # Wait for the socket to become writable
+            self.event.emit('SOCKET_CONNECT', resolver.addr)
+        else:
+            self.finish_connect(err)
+        return True
+
+    def finish_connect(self, err=None):
+        if err is None:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self.connect_failed(socket.error(err, os.strerror(err)))
+            return
+        self.connecting = False
+        self.connected = True
+        self.event.emit('net_connect', (self.host, self.port))
+        logger.debug("NETCORE: Connected to host: %s port: %s",
+                     self.host, self.port)
+
+    def connect_failed(self, error):
+        self.connecting = False
+        logger.error("NETCORE: Error on Connect")
+        self.event.emit('SOCKET_ERR', error)
 
     def set_proto_state(self, state):
         self.proto_state = state
@@ -111,39 +504,142 @@ class NetCore(object):
             self.comp_state = proto.PROTO_COMP_ON
 
     def push(self, packet):
-        data = packet.encode(self.comp_state, self.comp_threshold)
-        self.sbuff += (self.cipher.encrypt(data) if self.encrypted else data)
+        data = packet.encode(
+            self.comp_state,
+            max(self.comp_threshold, self.send_comp_threshold),
+            self.comp_level
+        )
+        self.queue_data(self.cipher.encrypt(data) if self.encrypted else data)
         self.event.emit(packet.ident, packet)
         self.event.emit(packet.str_ident, packet)
         self.sock.sending = True
 
+    def queue_data(self, data):
+        self.send_queue.append(data)
+        self.queued += len(data)
+        if self.high_water and not self.above_high_water \
+                and self.queued > self.high_water:
+            self.above_high_water = True
+            self.event.emit('net_high_water', self.queued)
+
+    def send(self):
+        """
+        Writes as much of the send queue as the socket takes in one call,
+        returns the number of bytes still queued
+        """
+        queue = self.send_queue
+        if not queue:
+            return 0
+        if hasattr(self.sock, 'sendmsg'):
+            sent = self.sock.sendmsg(list(itertools.islice(queue, IOV_MAX)))
+        else:
+            # No sendmsg on Windows and Python 2, join the queue instead
+            if len(queue) > 1:
+                data = bytearray()
+                for buff in queue:
+                    data += buff
+                queue.clear()
+                queue.append(data)
+            sent = self.sock.send(queue[0])
+        self.consume(sent)
+        return self.queued
+
+    def consume(self, count):
+        """
+        Drops count bytes that have been sent from the front of the queue
+        """
+        queue = self.send_queue
+        self.queued -= count
+        while count:
+            size = len(queue[0])
+            if count < size:
+                # A view, the rest of a large buffer isn't copied
+                queue[0] = memoryview(queue[0])[count:]
+                break
+            count -= size
+            queue.popleft()
+        if self.above_high_water and self.queued <= self.high_water // 4:
+            self.above_high_water = False
+            self.event.emit('net_low_water', self.queued)
+
     def push_packet(self, ident, data):
         self.push(mcpacket.Packet(ident, data))
 
+    # Only packets someone is listening for need their payload decoded
+    def has_handlers(self, packet):
+        handlers = self.event.event_handlers
+        return bool(handlers.get(packet.ident) or
+                    handlers.get(packet.str_ident))
+
+    def feed(self, view, size):
+        """
+        Adds the first size bytes of a receive buffer to the read buffer
+        without decoding them, see NetPlugin.handle_recv()
+        """
+        if self.encrypted:
+            self.cipher.decrypt_into(view, size)
+        self.rbuff.write(view[:size])
+
     def read_packet(self, data=b''):
-        self.rbuff.append(
-            self.cipher.decrypt(data) if self.encrypted else data)
+        if data:
+            self.rbuff.append(
+                self.cipher.decrypt(data) if self.encrypted else data)
+        payload_filter = self.has_handlers if self.lazy_decode else None
         while self.rbuff:
             self.rbuff.save()
             try:
                 packet = mcpacket.Packet(ident=(
                     self.proto_state,
                     proto.SERVER_TO_CLIENT
-                )).decode(self.rbuff, self.comp_state)
+                )).decode(self.rbuff, self.comp_state, payload_filter)
             except BufferUnderflowException:
                 self.rbuff.revert()
                 break
             except mcpacket.PacketDecodeFailure as err:
-                logger.warning('NETCORE: Packet decode failed')
-                logger.warning(
-                    'NETCORE: Failed packet ident is probably: %s',
-                    err.packet.str_ident
-                )
-                self.event.emit('PACKET_ERR', err)
+                self.decode_failed(err)
                 break
+            if packet is None:
+                continue
             self.event.emit(packet.ident, packet)
             self.event.emit(packet.str_ident, packet)
 
+    def read_bodies(self, bodies):
+        """
+        Decodes (pbuff, raw) packet bodies split off by the ReaderThread.
+        Raw ones still have to be inflated if compression is on
+        """
+        payload_filter = self.has_handlers if self.lazy_decode else None
+        for pbuff, raw in bodies:
+            packet = mcpacket.Packet(ident=(
+                self.proto_state,
+                proto.SERVER_TO_CLIENT
+            ))
+            try:
+                if raw and self.comp_state == proto.PROTO_COMP_ON:
+                    # Split before the reader saw compression turned on
+                    pbuff = BoundBuffer(mcpacket.read_body(
+                        pbuff, len(pbuff), self.comp_state
+                    ))
+                packet = packet.decode_body(pbuff, payload_filter)
+            except (zlib.error, BufferUnderflowException):
+                self.decode_failed(mcpacket.PacketDecodeFailure(packet, pbuff))
+                continue
+            except mcpacket.PacketDecodeFailure as err:
+                self.decode_failed(err)
+                continue
+            if packet is None:
+                continue
+            self.event.emit(packet.ident, packet)
+            self.event.emit(packet.str_ident, packet)
+
+    def decode_failed(self, err):
+        logger.warning('NETCORE: Packet decode failed')
+        logger.warning(
+            'NETCORE: Failed packet ident is probably: %s',
+            err.packet.str_ident
+        )
+        self.event.emit('PACKET_ERR', err)
+
     def enable_crypto(self, secret_key):
         self.cipher = AESCipher(secret_key)
         self.encrypted = True
@@ -152,19 +648,40 @@ class NetCore(object):
         self.cipher = None
         self.encrypted = False
 
-    def reset(self, sock):
-        self.__init__(sock, self.event)
-
 
 @pl_announce('Net')
 class NetPlugin(PluginBase):
     requires = ('Event', 'Timers')
     defaults = {
+        # Initial receive buffer size, it doubles up to bufsize_max while
+        # reads keep filling it
         'bufsize': 4096,
+        'bufsize_max': 1 << 18,
+        # Most bytes read per readiness event before the loop moves on
+        'recv_limit': 1 << 20,
         'sock_quit': True,
+        'lazy_decode': False,
+        # Poller backend, see get_poller(). Ignored in a shared Runtime
+        'poller': None,
+        # Seconds to resolve and connect before giving up
+        'connect_timeout': 10,
+        # Queued bytes that trigger net_high_water, 0 turns it off
+        'send_high_water': 1 << 20,
+        # zlib level for outgoing packets once the server enables
+        # compression, and the smallest packet to compress. Packets under
+        # the server's threshold are never compressed, -1 follows the server
+        'comp_level': 6,
+        'comp_threshold': -1,
+        # Receive, decrypt and inflate on a ReaderThread, the loop only
+        # decodes the bodies it queues, at most reader_queue of them
+        'reader_thread': False,
+        'reader_queue': 256,
     }
     events = {
         'event_tick': 'tick',
+        'net_connecting': 'handle_connecting',
+        'SOCKET_CONNECT': 'handle_sock_connect',
+        'net_connect': 'handle_connect',
         'SOCKET_RECV': 'handle_recv',
         'SOCKET_SEND': 'handle_send',
         'SOCKET_ERR': 'handle_err',
@@ -180,51 +697,190 @@ class NetPlugin(PluginBase):
     def __init__(self, ploader, settings):
         super(NetPlugin, self).__init__(ploader, settings)
         self.bufsize = self.settings['bufsize']
+        self.recv_max = self.settings['bufsize_max']
+        self.recv_limit = self.settings['recv_limit']
+        self.recv_view = memoryview(bytearray(self.bufsize + CIPHER_PAD))
         self.sock_quit = self.settings['sock_quit']
-        self.sock = SelectSocket(self.timers)
-        self.net = NetCore(self.sock, self.event)
+        self.runtime = getattr(ploader, 'runtime', None)
+        self.sock = self.make_sock()
+        self.net = self.make_net()
         self.sock_dead = False
+        self.connect_timer = None
+        self.resolve_timer = None
+        self.reader = None
+        self.waker = None
+        # Clients in a shared Runtime are polled by its poller
+        if self.runtime is not None:
+            self.poller = self.runtime.poller
+        else:
+            self.poller = get_poller(self.settings['poller'])
         ploader.provides('Net', self.net)
 
+    def make_sock(self):
+        return SelectSocket(self.timers)
+
+    def make_net(self):
+        return NetCore(self.sock, self.event, self.settings['lazy_decode'],
+                       self.settings['send_high_water'],
+                       self.settings['comp_level'],
+                       self.settings['comp_threshold'])
+
     def tick(self, name, data):
-        if self.net.connected:
-            for flag in self.sock.poll():
-                self.event.emit(flag)
+        if self.runtime is not None:
+            return
+        # Sleeps until the next timer while no socket is registered
+        self.poller.poll(self.timers.get_timeout())
+
+    def handle_connecting(self, name, data):
+        self.stop_connect_timers()
+        self.connect_timer = self.timers.reg_event_timer(
+            self.settings['connect_timeout'], self.handle_connect_timeout,
+            runs=1
+        )
+        if not self.net.check_resolver():
+            # The lookup runs on another thread, check back shortly
+            self.resolve_timer = self.timers.reg_event_timer(
+                0.01, self.check_resolver
+            )
+
+    def check_resolver(self):
+        if self.net.check_resolver():
+            self.resolve_timer.cancel()
+            self.resolve_timer = None
+
+    def handle_connect_timeout(self):
+        self.connect_timer = None
+        if self.net.connecting:
+            self.event.emit('SOCKET_ERR',
+                            socket.timeout('Timed out connecting'))
+
+    def stop_connect_timers(self):
+        for timer in (self.connect_timer, self.resolve_timer):
+            if timer is not None:
+                timer.cancel()
+        self.connect_timer = self.resolve_timer = None
+
+    def register_sock(self):
+        if self.sock.poller is None:
+            self.poller.register(self.sock, self.handle_recv,
+                                 self.handle_send, self.handle_err)
+
+    # SOCKET_CONNECT - Connect in progress, the socket turns writable once
+    # it's done
+    def handle_sock_connect(self, name, data):
+        self.register_sock()
+        self.sock.sending = True
+
+    # Readiness is reported by calling the handlers directly, without going
+    # through event emission
+    def handle_connect(self, name, data):
+        self.stop_connect_timers()
+        if self.settings['reader_thread']:
+            self.start_reader()
         else:
-            timeout = self.timers.get_timeout()
-            if timeout == -1:
-                time.sleep(1)
-            else:
-                time.sleep(timeout)
+            self.register_sock()
+
+    def start_reader(self):
+        # The loop keeps writing, the reader thread does all the reading
+        self.poller.unregister(self.sock)
+        self.poller.register(self.sock, None, self.handle_send,
+                             self.handle_err)
+        self.waker = Waker()
+        self.poller.register(self.waker, self.handle_bodies, None,
+                             self.handle_err)
+        self.reader = ReaderThread(self.net, self.sock, self.waker,
+                                   self.bufsize, self.settings['reader_queue'])
+        self.reader.start()
+
+    def stop_reader(self):
+        self.reader.stop()
+        self.reader.join(1)
+        self.reader = None
+        self.poller.unregister(self.waker)
+        self.waker.close()
+        self.waker = None
+
+    def close_sock(self):
+        self.stop_connect_timers()
+        if self.reader is not None:
+            self.stop_reader()
+        self.poller.unregister(self.sock)
+        self.sock.close()
 
     # SOCKET_RECV - Socket is ready to recieve data
+    # Reads until the socket is drained or recv_limit is reached, the
+    # packets are decoded once at the end
     def handle_recv(self, name, data):
-        if self.net.connected:
-            try:
-                data = self.sock.recv(self.bufsize)
-                if not data:
-                    self.event.emit('SOCKET_HUP')
-                    return
-                self.net.read_packet(data)
-            except socket.error as error:
+        if not self.net.connected:
+            return
+        total = 0
+        hup = False
+        try:
+            while total < self.recv_limit:
+                view = self.recv_view
+                want = len(view) - CIPHER_PAD
+                size = self.sock.recv_into(view, want)
+                if not size:
+                    hup = True
+                    break
+                total += size
+                self.net.feed(view, size)
+                if size < want:
+                    break
+                # Filled the buffer, a bigger one takes bursts in fewer calls
+                if len(view) < self.recv_max:
+                    self.recv_view = memoryview(bytearray(len(view) * 2))
+        except socket.error as error:
+            if error.errno not in WOULD_BLOCK:
                 self.event.emit('SOCKET_ERR', error)
+                return
+        if total:
+            self.net.read_packet()
+        if hup:
+            self.event.emit('SOCKET_HUP')
+
+    # Bodies queued by the reader thread, decoded up to recv_limit bytes of
+    # them at a time
+    def handle_bodies(self, name, data):
+        if self.reader is None:
+            return
+        self.waker.clear()
+        bodies = []
+        total = 0
+        sock_event = None
+        while total < self.recv_limit:
+            try:
+                kind, item = self.reader.bodies.get_nowait()
+            except Empty:
+                break
+            if kind != 'body':
+                sock_event = kind, item
+                break
+            bodies.append(item)
+            total += len(item[0])
+        else:
+            # Come back for the rest on the next poll
+            self.waker.wake()
+        self.net.read_bodies(bodies)
+        if sock_event is not None:
+            self.event.emit(*sock_event)
 
     # SOCKET_SEND - Socket is ready to send data and Send buffer contains
     # data to send
     def handle_send(self, name, data):
-        if self.net.connected:
+        if self.net.connecting:
+            self.net.finish_connect()
+        elif self.net.connected:
             try:
-                sent = self.sock.send(self.net.sbuff)
-                self.net.sbuff = self.net.sbuff[sent:]
-                if self.net.sbuff:
+                if self.net.send():
                     self.sock.sending = True
             except socket.error as error:
                 self.event.emit('SOCKET_ERR', error)
 
     # SOCKET_ERR - Socket Error has occured
     def handle_err(self, name, data):
-        self.sock.close()
-        self.sock = SelectSocket(self.timers)
+        self.close_sock()
+        self.sock = self.make_sock()
         self.net.reset(self.sock)
         logger.error("NETPLUGIN: Socket Error: %s", data)
         self.event.emit('net_disconnect', data)
@@ -234,8 +890,8 @@ class NetPlugin(PluginBase):
 
     # SOCKET_HUP - Socket has hung up
     def handle_hup(self, name, data):
-        self.sock.close()
-        self.sock = SelectSocket(self.timers)
+        self.close_sock()
+        self.sock = self.make_sock()
         self.net.reset(self.sock)
         logger.error("NETPLUGIN: Socket has hung up")
         self.event.emit('net_disconnect', "Socket Hung Up")
@@ -265,4 +921,6 @@ class NetPlugin(PluginBase):
             logger.debug("NETPLUGIN: Kill event received, closing socket")
             if not self.sock_dead:
                 self.sock.shutdown(socket.SHUT_WR)
-            self.sock.close()
+            self.close_sock()
+        elif self.net.connecting:
+            self.close_sock()
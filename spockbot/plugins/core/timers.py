@@ -4,6 +4,8 @@ registering them. Clock-time timers are as precise as the underlying OS
 makes them, server tick-timers are based on time updates from the server
 """
 
+import heapq
+import itertools
 import time
 
 from spockbot.plugins.base import PluginBase, pl_announce
@@ -13,6 +15,10 @@ class BaseTimer(object):
     def __init__(self, callback, runs=-1):
         self.callback = callback
         self.runs = runs
+        self.persist = False
+        # Insertion count of the timer's live heap entry, see TimersCore
+        self.heap_count = None
+        self.core = None
 
     def countdown(self):
         return -1
@@ -37,6 +43,16 @@ class BaseTimer(object):
     def stop(self):
         self.runs = 0
 
+    def cancel(self):
+        """
+        Stops the timer, and lets the TimersCore it is registered with
+        know its heap entry is garbage
+        """
+        live = self.runs and self.core is not None
+        self.stop()
+        if live:
+            self.core.timer_cancelled()
+
     def reset(self):
         pass
 
@@ -79,30 +95,121 @@ class TickTimer(BaseTimer):
 
 
 class TimersCore(object):
+    """
+    EventTimers and TickTimers are kept in binary heaps ordered by their
+    deadline, so finding the next deadline and registering a timer are
+    O(log n). Stopped timers are dropped lazily once they reach the top of
+    their heap. Any other BaseTimer is updated on every tick
+
+    Each timer has one live heap entry, the one whose insertion count
+    matches its heap_count, others are dropped when popped. A timer whose
+    deadline was pushed back with reset() is pushed again at the new one
+    when its old entry comes up. Timers cancelled with cancel() are
+    counted, the heaps are rebuilt once they make up most of them
+    """
+
     def __init__(self, world):
-        self.timers = []
-        self.persist_timers = []
+        # Heaps of (deadline, insertion count, timer)
+        self.event_timers = []
+        self.tick_timers = []
+        self.other_timers = []
+        self.counter = itertools.count()
         self.world = world
+        # Cancelled entries left in the heaps, roughly, some may have been
+        # popped since
+        self.cancelled = 0
 
     def reg_timer(self, timer, persist=False):
-        if not persist:
-            self.timers.append(timer)
+        """
+        Returns the timer, call its cancel() method to cancel it
+        """
+        timer.persist = persist
+        self.push_timer(timer)
+        return timer
+
+    def push_timer(self, timer):
+        if not timer.get_runs():
+            return
+        if isinstance(timer, EventTimer):
+            heap, deadline = self.event_timers, timer.end_time
+        elif isinstance(timer, TickTimer):
+            heap, deadline = self.tick_timers, timer.end_tick
         else:
-            self.persist_timers.append(timer)
+            self.other_timers.append(timer)
+            return
+        timer.core = self
+        timer.heap_count = next(self.counter)
+        heapq.heappush(heap, (deadline, timer.heap_count, timer))
+
+    def timer_cancelled(self):
+        self.cancelled += 1
+        if 2 * self.cancelled > len(self.event_timers) + len(self.tick_timers):
+            self.compact()
+
+    def compact(self):
+        """ Drops every dead heap entry """
+        self.event_timers = [e for e in self.event_timers if self.is_live(e)]
+        self.tick_timers = [e for e in self.tick_timers if self.is_live(e)]
+        heapq.heapify(self.event_timers)
+        heapq.heapify(self.tick_timers)
+        self.cancelled = 0
+
+    @staticmethod
+    def is_live(entry):
+        return entry[2].heap_count == entry[1] and entry[2].get_runs()
 
     def get_timeout(self):
-        timeout = -1
-        for timer in self.timers + self.persist_timers:
-            if timeout > timer.countdown() or timeout == -1:
-                timeout = timer.countdown()
-        return timeout
+        for heap in (self.tick_timers, self.event_timers):
+            while heap and not self.is_live(heap[0]):
+                heapq.heappop(heap)
+        if not heap:
+            return -1
+        timeout = heap[0][0] - time.time()
+        return timeout if timeout > 0 else 0
 
     def reg_event_timer(self, wait_time, callback, runs=-1, persist=False):
-        self.reg_timer(EventTimer(wait_time, callback, runs), persist)
+        return self.reg_timer(EventTimer(wait_time, callback, runs), persist)
 
     def reg_tick_timer(self, wait_ticks, callback, runs=-1, persist=False):
-        self.reg_timer(TickTimer(self.world, wait_ticks, callback, runs),
-                       persist)
+        return self.reg_timer(
+            TickTimer(self.world, wait_ticks, callback, runs), persist
+        )
+
+    def run_timers(self):
+        self.run_heap(self.event_timers, time.time())
+        self.run_heap(self.tick_timers, self.world.age)
+        if self.other_timers:
+            for timer in self.other_timers:
+                timer.update()
+            self.other_timers = [
+                timer for timer in self.other_timers if timer.get_runs()
+            ]
+
+    def run_heap(self, heap, now):
+        # Pop everything that is due before firing, timers rescheduled or
+        # registered by the callbacks only run on the next tick
+        due = []
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if self.is_live(entry):
+                due.append(entry[2])
+        for timer in due:
+            # Stopped by an earlier callback
+            if not timer.get_runs():
+                continue
+            if timer.check():
+                timer.fire()
+            self.push_timer(timer)
+
+    def clear_timers(self):
+        """
+        Drop all timers that weren't registered as persistent
+        """
+        self.event_timers = [i for i in self.event_timers if i[2].persist]
+        self.tick_timers = [i for i in self.tick_timers if i[2].persist]
+        heapq.heapify(self.event_timers)
+        heapq.heapify(self.tick_timers)
+        self.other_timers = [i for i in self.other_timers if i.persist]
 
 
 class WorldTick(object):
@@ -115,6 +222,7 @@ class TimersPlugin(PluginBase):
     requires = 'World'
     events = {
         'event_tick': 'tick',
+        'event_kill': 'handle_kill',
         'net_disconnect': 'handle_disconnect',
     }
 
@@ -125,21 +233,21 @@ class TimersPlugin(PluginBase):
             ploader.reg_event_handler('PLAY<Time Update',
                                       self.handle_time_update)
         self.timer_core = TimersCore(self.world)
+        self.runtime = getattr(ploader, 'runtime', None)
+        if self.runtime is not None:
+            self.runtime.reg_timers(self.timer_core)
         ploader.provides('Timers', self.timer_core)
 
     def tick(self, name, data):
-        for timer in self.timer_core.timers:
-            timer.update()
-            if not timer.get_runs():
-                self.timer_core.timers.remove(timer)
-        for timer in self.timer_core.persist_timers:
-            timer.update()
-            if not timer.get_runs():
-                self.timer_core.persist_timers.remove(timer)
+        self.timer_core.run_timers()
 
     # Time Update - We grab world age if the world plugin isn't available
     def handle_time_update(self, name, packet):
         self.world.age = packet.data['world_age']
 
     def handle_disconnect(self, name, data):
-        self.timer_core.timers = []
+        self.timer_core.clear_timers()
+
+    def handle_kill(self, name, data):
+        if self.runtime is not None:
+            self.runtime.unreg_timers(self.timer_core)
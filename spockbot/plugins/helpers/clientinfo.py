@@ -20,7 +20,6 @@ class Position(Vector3, Info):
 
     def get_dict(self):
         d = self.__dict__.copy()
-        del d['vector']
         d['x'], d['y'], d['z'] = self
         return d
 
@@ -1,9 +1,29 @@
 """
 An entity tracker
+
+Entities with a position are also bucketed by chunk column in a
+SpatialIndex, so EntitiesCore.within() and nearest() only look at the
+columns around the queried position
+
+With the entity_table setting the movement state of players, mobs and
+objects lives in the parallel arrays of an EntityTable instead, see
+EntityTable.predict() for extrapolating all their positions at once
 """
+import heapq
+import time
+from array import array
+
 from spockbot.mcdata.utils import Info
 from spockbot.plugins.base import PluginBase, pl_announce
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Velocities are in 1/8000 block per tick, this many per block per second
+VELOCITY_SCALE = 8000.0 / 20
+
 
 class MCEntity(Info):
     eid = 0
@@ -69,6 +89,278 @@ class GlobalEntity(MCEntity):
     z = 0
 
 
+class EntityTable(object):
+    """
+    Movement state of entities as parallel arrays, one row per entity.
+    Removing an entity moves the last row into its place
+    """
+    columns = ('x', 'y', 'z', 'velocity_x', 'velocity_y', 'velocity_z',
+               'yaw', 'pitch', 'updated')
+
+    def __init__(self):
+        self.eids = array('i')
+        # Mob or object type, -1 for players
+        self.types = array('i')
+        for name in self.columns:
+            setattr(self, name, array('d'))
+        # eid: row
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.eids)
+
+    def add(self, eid, entity_type=-1, now=None):
+        if eid in self.rows:
+            self.remove(eid)
+        self.rows[eid] = len(self.eids)
+        self.eids.append(eid)
+        self.types.append(entity_type)
+        for name in self.columns:
+            getattr(self, name).append(0)
+        self.updated[-1] = time.time() if now is None else now
+
+    def remove(self, eid):
+        row = self.rows.pop(eid)
+        last = len(self.eids) - 1
+        if row != last:
+            self.eids[row] = self.eids[last]
+            self.rows[self.eids[row]] = row
+        for column in (self.eids, self.types) + tuple(
+                getattr(self, name) for name in self.columns):
+            column[row] = column[last]
+            column.pop()
+
+    def touch(self, eid, now=None):
+        """ Marks the position of eid as just updated by the server """
+        self.updated[self.rows[eid]] = time.time() if now is None else now
+
+    def set_velocity(self, eid, vx, vy, vz, now=None):
+        # The old velocity moved the entity up to now
+        now = time.time() if now is None else now
+        row = self.rows[eid]
+        self.x[row], self.y[row], self.z[row] = self.predict_row(row, now)
+        self.updated[row] = now
+        self.velocity_x[row] = vx
+        self.velocity_y[row] = vy
+        self.velocity_z[row] = vz
+
+    def predict_row(self, row, now=None):
+        dt = ((time.time() if now is None else now) - self.updated[row]) \
+            / VELOCITY_SCALE
+        return (self.x[row] + self.velocity_x[row] * dt,
+                self.y[row] + self.velocity_y[row] * dt,
+                self.z[row] + self.velocity_z[row] * dt)
+
+    def predict(self, now=None):
+        """
+        Positions of all entities at now, dead reckoned from their last
+        known position and velocity. Returns (xs, ys, zs) in row order, see
+        eids. They are numpy arrays if numpy is installed
+        """
+        now = time.time() if now is None else now
+        if numpy is not None and len(self.eids):
+            dt = (now - numpy.frombuffer(self.updated)) / VELOCITY_SCALE
+            return tuple(
+                numpy.frombuffer(getattr(self, pos)) +
+                numpy.frombuffer(getattr(self, vel)) * dt
+                for pos, vel in (('x', 'velocity_x'), ('y', 'velocity_y'),
+                                 ('z', 'velocity_z'))
+            )
+        dts = [(now - t) / VELOCITY_SCALE for t in self.updated]
+        return tuple(
+            array('d', [p + v * dt for p, v, dt in
+                        zip(getattr(self, pos), getattr(self, vel), dts)])
+            for pos, vel in (('x', 'velocity_x'), ('y', 'velocity_y'),
+                             ('z', 'velocity_z'))
+        )
+
+
+def table_column(name):
+    def get(self):
+        return getattr(self.table, name)[self.table.rows[self.eid]]
+
+    def set(self, value):
+        getattr(self.table, name)[self.table.rows[self.eid]] = value
+    return property(get, set)
+
+
+class TableEntity(object):
+    """
+    An entity whose movement attributes are stored in an EntityTable row
+    """
+    x = table_column('x')
+    y = table_column('y')
+    z = table_column('z')
+    velocity_x = table_column('velocity_x')
+    velocity_y = table_column('velocity_y')
+    velocity_z = table_column('velocity_z')
+    yaw = table_column('yaw')
+    pitch = table_column('pitch')
+
+    def __init__(self, table, eid, entity_type=-1):
+        self.table = table
+        self.eid = eid
+        table.add(eid, entity_type)
+
+    def detach(self):
+        """
+        Moves the row into a table of its own, so the entity keeps its
+        attributes once it's gone from the shared one
+        """
+        table = EntityTable()
+        table.add(self.eid, now=self.table.updated[self.table.rows[self.eid]])
+        for name in EntityTable.columns:
+            getattr(table, name)[0] = getattr(self.table, name)[
+                self.table.rows[self.eid]]
+        self.table.remove(self.eid)
+        self.table = table
+
+    def predict(self, now=None):
+        """ Dead reckoned (x, y, z) at now, see EntityTable.predict() """
+        return self.table.predict_row(self.table.rows[self.eid], now)
+
+    def get_dict(self):
+        data = dict(self.__dict__)
+        del data['table']
+        for name in EntityTable.columns[:-1]:
+            data[name] = getattr(self, name)
+        return data
+
+
+class TablePlayerEntity(TableEntity, PlayerEntity):
+    pass
+
+
+class TableObjectEntity(TableEntity, ObjectEntity):
+    pass
+
+
+class TableMobEntity(TableEntity, MobEntity):
+    pass
+
+
+table_entities = {
+    PlayerEntity: TablePlayerEntity,
+    ObjectEntity: TableObjectEntity,
+    MobEntity: TableMobEntity,
+}
+
+
+def get_position(entity):
+    if isinstance(entity, PaintingEntity):
+        location = entity.location
+        return location['x'], location['y'], location['z']
+    return entity.x, entity.y, entity.z
+
+
+class SpatialIndex(object):
+    """
+    Entities bucketed into cell_size x cell_size columns by their x and z
+    """
+    def __init__(self, cell_size=16):
+        self.cell_size = cell_size
+        # (cell x, cell z): {eid: entity}
+        self.cells = {}
+        # eid: (cell x, cell z)
+        self.cell_of = {}
+
+    def get_cell(self, x, z):
+        return int(x // self.cell_size), int(z // self.cell_size)
+
+    def add(self, eid, entity):
+        x, y, z = get_position(entity)
+        cell = self.get_cell(x, z)
+        old_cell = self.cell_of.get(eid)
+        if old_cell == cell:
+            return
+        if old_cell is not None:
+            self.remove(eid)
+        self.cells.setdefault(cell, {})[eid] = entity
+        self.cell_of[eid] = cell
+
+    # Entities are moved by adding them again
+    move = add
+
+    def remove(self, eid):
+        cell = self.cell_of.pop(eid, None)
+        if cell is not None:
+            bucket = self.cells[cell]
+            del bucket[eid]
+            if not bucket:
+                del self.cells[cell]
+
+    def ring(self, cx, cz, r):
+        """ The cells r cells away from (cx, cz), that exist """
+        if r == 0:
+            cells = [(cx, cz)]
+        else:
+            cells = [(x, z) for x in range(cx - r, cx + r + 1)
+                     for z in (cz - r, cz + r)]
+            cells.extend((x, z) for x in (cx - r, cx + r)
+                         for z in range(cz - r + 1, cz + r))
+        return [self.cells[cell] for cell in cells if cell in self.cells]
+
+    def within(self, pos, radius):
+        """ (distance squared, eid, entity) of entities within radius """
+        x, y, z = pos
+        radius_sq = radius * radius
+        low_x, low_z = self.get_cell(x - radius, z - radius)
+        high_x, high_z = self.get_cell(x + radius, z + radius)
+        if (high_x - low_x + 1) * (high_z - low_z + 1) > len(self.cells):
+            # Cheaper to go through the occupied cells
+            buckets = [bucket for (cx, cz), bucket in self.cells.items()
+                       if low_x <= cx <= high_x and low_z <= cz <= high_z]
+        else:
+            buckets = [self.cells[(cx, cz)]
+                       for cx in range(low_x, high_x + 1)
+                       for cz in range(low_z, high_z + 1)
+                       if (cx, cz) in self.cells]
+        ret = []
+        for bucket in buckets:
+            for eid, entity in bucket.items():
+                ex, ey, ez = get_position(entity)
+                dist_sq = (ex - x) ** 2 + (ey - y) ** 2 + (ez - z) ** 2
+                if dist_sq <= radius_sq:
+                    ret.append((dist_sq, eid, entity))
+        return ret
+
+    def nearest(self, pos, k=1, accept=None):
+        """
+        (distance squared, eid, entity) of the k nearest entities, closest
+        first. Columns are searched in growing rings until the rest are too
+        far away to matter. accept(eid) filters the entities
+        """
+        x, y, z = pos
+        cx, cz = self.get_cell(x, z)
+        found = []
+        seen = 0
+        r = 0
+        while seen < len(self.cells):
+            if 8 * r > len(self.cells) - seen:
+                # Sparse out here, go through the remaining cells at once
+                buckets = [bucket for (bx, bz), bucket in self.cells.items()
+                           if max(abs(bx - cx), abs(bz - cz)) >= r]
+                r = max(max(abs(bx - cx), abs(bz - cz))
+                        for bx, bz in self.cells)
+            else:
+                buckets = self.ring(cx, cz, r)
+            seen += len(buckets)
+            for bucket in buckets:
+                for eid, entity in bucket.items():
+                    if accept is not None and not accept(eid):
+                        continue
+                    ex, ey, ez = get_position(entity)
+                    dist_sq = (ex - x) ** 2 + (ey - y) ** 2 + (ez - z) ** 2
+                    found.append((dist_sq, eid, entity))
+            if len(found) >= k:
+                found = heapq.nsmallest(k, found)
+                # Cells past this ring are at least r cells away
+                if found[-1][0] <= (r * self.cell_size) ** 2:
+                    break
+            r += 1
+        return sorted(found)[:k]
+
+
 class EntitiesCore(object):
     def __init__(self):
         self.client_player = MCEntity()
@@ -79,11 +371,41 @@ class EntitiesCore(object):
         self.paintings = {}
         self.exp_orbs = {}
         self.global_entities = {}
+        self.index = SpatialIndex()
+        # EntityTable of players, mobs and objects, see entity_table
+        self.table = None
+
+    def within(self, pos, radius, kind=None):
+        """
+        Entities within radius blocks of pos, closest first. kind names one
+        of the entity dicts, like 'mobs', and limits the search to it
+        """
+        members = self.entities if kind is None else getattr(self, kind)
+        return [entity for dist_sq, eid, entity in
+                sorted(self.index.within(pos, radius)) if eid in members]
+
+    def nearest(self, kind, pos, k=1):
+        """
+        The k entities closest to pos, closest first. kind is as for
+        within(), None searches all entities
+        """
+        members = self.entities if kind is None else getattr(self, kind)
+        return [entity for dist_sq, eid, entity in
+                self.index.nearest(pos, k, members.__contains__)]
 
 
 @pl_announce('Entities')
 class EntitiesPlugin(PluginBase):
     requires = 'Event'
+    defaults = {
+        # Keep the movement state of players, mobs and objects in an
+        # EntityTable
+        'entity_table': False,
+        # Emit one entity_moves event per client tick with every entity
+        # that moved since the last one, instead of an entity_move event
+        # per packet
+        'coalesce_moves': False,
+    }
     events = {
         'PLAY<Join Game': 'handle_join_game',
         'PLAY<Spawn Player': 'handle_spawn_player',
@@ -106,13 +428,24 @@ class EntitiesPlugin(PluginBase):
         'PLAY<Entity Properties': 'handle_unhandled',
         'PLAY<Spawn Global Entity': 'handle_spawn_global_entity',
         'PLAY<Update Entity NBT': 'handle_set_dict',
+        'client_tick': 'handle_client_tick',
     }
 
     def __init__(self, ploader, settings):
         super(EntitiesPlugin, self).__init__(ploader, settings)
         self.ec = EntitiesCore()
+        if self.settings['entity_table']:
+            self.ec.table = EntityTable()
+        # eid: position before the first move since the last entity_moves
+        self.moves = {} if self.settings['coalesce_moves'] else None
         ploader.provides('Entities', self.ec)
 
+    def make_entity(self, cls, packet, entity_type=-1):
+        if self.ec.table is None or cls not in table_entities:
+            return cls()
+        return table_entities[cls](self.ec.table, packet.data['eid'],
+                                   entity_type)
+
     # TODO: Implement all these things
     def handle_unhandled(self, event, packet):
         pass
@@ -122,26 +455,35 @@ class EntitiesPlugin(PluginBase):
         self.ec.entities[packet.data['eid']] = self.ec.client_player
 
     def handle_spawn_player(self, event, packet):
-        entity = PlayerEntity()
+        entity = self.make_entity(PlayerEntity, packet)
         entity.set_dict(packet.data)
         self.ec.entities[packet.data['eid']] = entity
         self.ec.players[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_player', entity)
 
     def handle_spawn_object(self, event, packet):
-        entity = ObjectEntity()
+        entity = self.make_entity(ObjectEntity, packet,
+                                  packet.data['obj_type'])
         entity.set_dict(packet.data)
+        if isinstance(entity, TableEntity) and 'speed_x' in packet.data:
+            entity.velocity_x = packet.data['speed_x']
+            entity.velocity_y = packet.data['speed_y']
+            entity.velocity_z = packet.data['speed_z']
         self.ec.entities[packet.data['eid']] = entity
         self.ec.objects[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_object', entity)
 
     def handle_spawn_mob(self, event, packet):
-        entity = MobEntity()
+        entity = self.make_entity(MobEntity, packet,
+                                  packet.data['mob_type'])
         entity.set_dict(packet.data)
         self.ec.entities[packet.data['eid']] = entity
         self.ec.mobs[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_mob', entity)
 
@@ -150,6 +492,7 @@ class EntitiesPlugin(PluginBase):
         entity.set_dict(packet.data)
         self.ec.entities[packet.data['eid']] = entity
         self.ec.paintings[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_painting', entity)
 
@@ -158,6 +501,7 @@ class EntitiesPlugin(PluginBase):
         entity.set_dict(packet.data)
         self.ec.entities[packet.data['eid']] = entity
         self.ec.exp_orbs[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_exp_orb', entity)
 
@@ -166,6 +510,7 @@ class EntitiesPlugin(PluginBase):
         entity.set_dict(packet.data)
         self.ec.entities[packet.data['eid']] = entity
         self.ec.global_entities[packet.data['eid']] = entity
+        self.ec.index.add(packet.data['eid'], entity)
         self.event.emit('entity_spawn', {'entity': entity})
         self.event.emit('entity_spawn_global', entity)
 
@@ -174,6 +519,11 @@ class EntitiesPlugin(PluginBase):
             if eid in self.ec.entities:
                 entity = self.ec.entities[eid]
                 del self.ec.entities[eid]
+                self.ec.index.remove(eid)
+                if self.moves:
+                    self.moves.pop(eid, None)
+                if isinstance(entity, TableEntity):
+                    entity.detach()
                 if eid in self.ec.players:
                     del self.ec.players[eid]
                 elif eid in self.ec.objects:
@@ -192,19 +542,55 @@ class EntitiesPlugin(PluginBase):
         if packet.data['eid'] in self.ec.entities:
             entity = self.ec.entities[packet.data['eid']]
             old_pos = [entity.x, entity.y, entity.z]
+            if self.moves is not None and entity.eid not in self.moves:
+                self.moves[entity.eid] = old_pos
             entity.set_dict(packet.data)
             entity.x = entity.x + packet.data['dx']
             entity.y = entity.y + packet.data['dy']
             entity.z = entity.z + packet.data['dz']
-            self.event.emit('entity_move',
-                            {'entity': entity, 'old_pos': old_pos})
+            self.ec.index.move(packet.data['eid'], entity)
+            if isinstance(entity, TableEntity):
+                self.ec.table.touch(entity.eid)
+            if self.moves is None:
+                self.event.emit('entity_move',
+                                {'entity': entity, 'old_pos': old_pos})
+
+    # Coalesced moves - Entities that moved since the last client tick, with
+    # their position before and how far they moved since
+    def handle_client_tick(self, event, data):
+        if not self.moves:
+            return
+        moves = []
+        for eid, old_pos in self.moves.items():
+            entity = self.ec.entities[eid]
+            moves.append({
+                'entity': entity,
+                'old_pos': old_pos,
+                'delta': [entity.x - old_pos[0], entity.y - old_pos[1],
+                          entity.z - old_pos[2]],
+            })
+        self.moves = {}
+        self.event.emit('entity_moves', moves)
 
     def handle_velocity(self, event, packet):
-        if packet.data['eid'] in self.ec.entities:
-            self.ec.entities[packet.data['eid']].set_dict(packet.data)
+        entity = self.ec.entities.get(packet.data['eid'])
+        if isinstance(entity, TableEntity):
+            self.ec.table.set_velocity(
+                entity.eid, packet.data['velocity_x'],
+                packet.data['velocity_y'], packet.data['velocity_z']
+            )
+        elif entity is not None:
+            entity.set_dict(packet.data)
         if packet.data['eid'] == self.ec.client_player.eid:
             self.event.emit('entity_player_velocity', packet.data)
 
     def handle_set_dict(self, event, packet):
         if packet.data['eid'] in self.ec.entities:
-            self.ec.entities[packet.data['eid']].set_dict(packet.data)
+            entity = self.ec.entities[packet.data['eid']]
+            entity.set_dict(packet.data)
+            # Teleported
+            if 'x' in packet.data and packet.data['eid'] in \
+                    self.ec.index.cell_of:
+                self.ec.index.move(packet.data['eid'], entity)
+                if isinstance(entity, TableEntity):
+                    self.ec.table.touch(entity.eid)
@@ -250,8 +250,7 @@ class InventoryPlugin(PluginBase):
         else:  # click not accepted
             self.is_synchronized = False
             # confirm that we received this packet
-            packet.new_ident('PLAY>Confirm Transaction')
-            self.net.push(packet)
+            self.net.push_packet('PLAY>Confirm Transaction', packet.data)
             # 1.8 server will re-send all slots now
             self.event.reg_event_handler('inventory_synced',
                                          emit_click_response)
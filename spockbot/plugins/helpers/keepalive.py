@@ -14,5 +14,4 @@ class KeepalivePlugin(PluginBase):
 
     # Keep Alive - Reflects data back to server
     def handle_keep_alive(self, name, packet):
-        packet.new_ident('PLAY>Keep Alive')
-        self.net.push(packet)
+        self.net.push_packet('PLAY>Keep Alive', packet.data)
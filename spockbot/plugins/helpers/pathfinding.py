@@ -4,6 +4,13 @@ Implements the Lazy Theta* pathfinding algorithm
 """
 
 import collections
+import heapq
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import stat
 
 from spockbot.mcdata import blocks, constants as const
 from spockbot.mcdata.utils import BoundingBox
@@ -12,8 +19,10 @@ from spockbot.plugins.tools.collision import(
     MTVTest, center_position, uncenter_position  # noqa
 )
 from spockbot.plugins.tools.event import EVENT_UNREGISTER
+from spockbot.plugins.tools.smpmap import Dimension
 from spockbot.vector import Vector3
 
+logger = logging.getLogger('spockbot')
 
 FOUND_VALID_PATH = 0x01
 TIMEOUT_REACHED = 0x02
@@ -27,19 +36,56 @@ class PathfindingCore(object):
 
 
 class Path(object):
-    def __init__(self, start_node, end_node):
+    def __init__(self, start_node, end_node, bounds=None):
         self.end_node = end_node
-        self.open_list = [start_node]
-        self.closed_list = []
+        # Optional ((x0, y0, z0), (x1, y1, z1)) box, inclusive, nodes outside
+        # of it are never queued
+        self.bounds = bounds
+        # Binary heap of (f value, insertion count, node), stale entries for
+        # blocks that have since been closed are skipped when popped
+        self.open_list = []
+        # Block coordinates: best node_dist queued in open_list
+        self.open_dists = {}
+        self.closed_set = set()
+        self.counter = itertools.count()
         self.result = None
+        self.push(start_node)
 
     def calc_f_val(self, node):
         return node.node_dist + self.end_node.dist(node)
 
+    def push(self, node):
+        if node.key in self.closed_set:
+            return
+        if self.bounds is not None:
+            low, high = self.bounds
+            if not all(a <= k <= b for a, k, b in zip(low, node.key, high)):
+                return
+        node_dist = self.open_dists.get(node.key)
+        if node_dist is not None and node_dist <= node.node_dist:
+            return
+        self.open_dists[node.key] = node.node_dist
+        heapq.heappush(self.open_list,
+                       (self.calc_f_val(node), next(self.counter), node))
+
+    def pop(self):
+        while self.open_list:
+            node = heapq.heappop(self.open_list)[2]
+            if node.key not in self.closed_set:
+                self.closed_set.add(node.key)
+                del self.open_dists[node.key]
+                return node
+        return None
+
 
 class PathNode(Vector3):
+    __slots__ = ('key', 'parent', 'node_dist', 'is_fall', 'is_jump')
+
     def __init__(self, *xyz):
         super(PathNode, self).__init__(*xyz)
+        # Integer block coordinates, used to hash the open and closed sets
+        self.key = (int(math.floor(self.x)), int(math.floor(self.y)),
+                    int(math.floor(self.z)))
         self.parent = None
         self.node_dist = 0
         self.is_fall = False
@@ -59,15 +105,27 @@ class PathNode(Vector3):
 @pl_announce('Pathfinding')
 class PathfindingPlugin(PluginBase):
     requires = ('Event', 'World', 'Physics', 'ClientInfo', 'Timers')
+    defaults = {
+        # Number of worker processes to run searches in, 0 searches inline
+        # on the event loop
+        'worker_processes': 0,
+        # Blocks of world around start and target handed to the workers
+        'worker_margin': 32,
+    }
+    events = {
+        'event_kill': 'handle_kill',
+    }
 
     def __init__(self, ploader, settings):
         super(PathfindingPlugin, self).__init__(ploader, settings)
 
         self.bounding_box = BoundingBox(w=0.6, h=1.8)
         self.path_job = None
-        self.col = MTVTest(
-            self.world, BoundingBox(const.PLAYER_WIDTH, const.PLAYER_HEIGHT)
-        )
+        self.worker_job = None
+        self.pool = None
+        if self.settings['worker_processes']:
+            self.pool = make_pool(self.settings['worker_processes'])
+        self.search = PathSearch(self.world, self.timers)
         ploader.provides('Pathfinding', PathfindingCore(self.start_path))
 
     def build_list_from_node(self, node):
@@ -80,6 +138,9 @@ class PathfindingPlugin(PluginBase):
     def start_path(self, pos, target, scb, fcb=None):
         pos = center_position(pos.floor(), BoundingBox(1, 1))
         target = center_position(target.floor(), BoundingBox(1, 1))
+        if self.settings['worker_processes']:
+            self.start_worker_path(pos, target, scb, fcb)
+            return
         new_job = Path(PathNode(pos), PathNode(target)), scb, fcb
         if self.path_job:
             self.path_job = new_job
@@ -90,18 +151,82 @@ class PathfindingPlugin(PluginBase):
 
     def do_job(self, _=None, __=None):
         path, scb, fcb = self.path_job
-        ret = self.pathfind(path)
+        ret = self.search.pathfind(path)
         if ret == FOUND_VALID_PATH:
             self.path_job = None
             scb(self.build_list_from_node(path.result))
             return EVENT_UNREGISTER
-        elif ret == NO_VALID_PATH and fcb:
+        elif ret == NO_VALID_PATH:
             self.path_job = None
-            fcb(None)
+            if fcb:
+                fcb(None)
+            return EVENT_UNREGISTER
+
+    def start_worker_path(self, pos, target, scb, fcb):
+        margin = self.settings['worker_margin']
+        low = [int(math.floor(min(a, b))) - margin
+               for a, b in zip(pos, target)]
+        high = [int(math.floor(max(a, b))) + margin
+                for a, b in zip(pos, target)]
+        sections = self.world.get_snapshot(*(low + high))
+        result = self.pool.apply_async(find_path_in_snapshot, (
+            sections, (tuple(low), tuple(high)),
+            tuple(pos), tuple(target),
+        ))
+        # A job that is still running is replaced, its result is dropped
+        if not self.worker_job:
+            self.event.reg_event_handler('event_tick', self.check_worker_job)
+        self.worker_job = result, scb, fcb
+
+    def check_worker_job(self, _=None, __=None):
+        result, scb, fcb = self.worker_job
+        if not result.ready():
+            return
+        self.worker_job = None
+        try:
+            nodes = result.get()
+        except Exception:
+            logger.exception('PATHFINDING: Worker search failed')
+            nodes = None
+        if nodes is None:
+            if fcb:
+                fcb(None)
+        else:
+            node = None
+            for x, y, z, is_fall, is_jump in nodes:
+                node = PathNode(x, y, z).set(node, is_fall, is_jump)
+            scb(self.build_list_from_node(node))
+        return EVENT_UNREGISTER
+
+    def handle_kill(self, _, __):
+        if self.pool is not None:
+            # Joined so no worker outlives the client, or is left to the
+            # pool's finalizer at interpreter exit
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+
+class PathSearch(object):
+    """
+    The search itself, kept apart from the plugin so it can also run on a
+    world snapshot in a worker process. Without timers the search runs until
+    it finds a path or runs out of nodes
+    """
+
+    def __init__(self, world, timers=None):
+        self.world = world
+        self.timers = timers
+        self.col = MTVTest(
+            world, BoundingBox(const.PLAYER_WIDTH, const.PLAYER_HEIGHT)
+        )
 
     def pathfind(self, path):
-        while path.open_list and self.timers.get_timeout():
-            cur_node = path.open_list.pop(0)
+        while path.open_list and \
+                (self.timers is None or self.timers.get_timeout()):
+            cur_node = path.pop()
+            if cur_node is None:
+                break
             p = cur_node.parent
             if p is not None and not (p.is_fall or p.is_jump):
                 p = cur_node.parent.parent
@@ -109,15 +234,12 @@ class PathfindingPlugin(PluginBase):
                         and self.raycast_bbox(p, cur_node):
                     cur_node.parent = p
                     cur_node.node_dist = p.node_dist + cur_node.dist(p)
-            if cur_node == path.end_node:
+            if cur_node.key == path.end_node.key:
                 path.result = cur_node
                 return FOUND_VALID_PATH
             for valid_node in self.find_valid_nodes(cur_node):
-                if valid_node not in (path.open_list + path.closed_list):
-                    path.open_list.append(valid_node)
-            path.open_list.sort(key=path.calc_f_val)
-            path.closed_list.append(cur_node)
-        if not path.open_list and cur_node != path.end_node:
+                path.push(valid_node)
+        if not path.open_list:
             return NO_VALID_PATH
         return TIMEOUT_REACHED
 
@@ -139,8 +261,7 @@ class PathfindingPlugin(PluginBase):
         return True
 
     def get_block(self, pos):
-        block_id, meta = self.world.get_block(*pos.vector)
-        return blocks.get_block(block_id, meta)
+        return blocks.block_states[self.world.get_block_data(*pos)]
 
     def check_for_bbox(self, pos):
         pos = pos.floor()
@@ -190,3 +311,52 @@ class PathfindingPlugin(PluginBase):
                         neg_x and pos_z, neg_jump_x and pos_jump_z)
 
         return node_list
+
+
+def make_pool(processes):
+    """
+    Forking the running client would hand its sockets to the workers, and
+    copy any lock another thread holds, so workers are forked from a fresh
+    forkserver where there is one. Python 2 forks the client, which is why
+    the pool is made when the plugin loads, before any thread is started,
+    and its workers close the sockets they inherit
+    """
+    try:
+        context = multiprocessing.get_context('forkserver')
+    except (AttributeError, ValueError):
+        return multiprocessing.Pool(processes, close_inherited_sockets)
+    return context.Pool(processes)
+
+
+def close_inherited_sockets():
+    # Otherwise closing the connection in the client doesn't end it while
+    # the workers are alive. The pool's own queues are pipes
+    try:
+        fds = [int(fd) for fd in os.listdir('/dev/fd')]
+    except OSError:
+        return
+    for fd in fds:
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+
+
+def find_path_in_snapshot(sections, bounds, pos, target):
+    """
+    Process pool entry point, returns the path as a list of
+    (x, y, z, is_fall, is_jump) tuples or None if there is no valid path
+    """
+    world = Dimension(const.SMP_OVERWORLD)
+    world.load_snapshot(sections)
+    path = Path(PathNode(*pos), PathNode(*target), bounds)
+    if PathSearch(world).pathfind(path) != FOUND_VALID_PATH:
+        return None
+    ret = []
+    node = path.result
+    while node is not None:
+        ret.append((node.x, node.y, node.z, node.is_fall, node.is_jump))
+        node = node.parent
+    ret.reverse()
+    return ret
@@ -106,10 +106,9 @@ class PhysicsPlugin(PluginBase):
     def get_block_slip(self):
         if self.pos.on_ground:
             block_pos = self.pos.floor()
-            block_id, meta = self.world.get_block(
+            return blocks.block_states[self.world.get_block_data(
                 block_pos.x, block_pos.y - 1, block_pos.z
-            )
-            return blocks.get_block(block_id, meta).slipperiness
+            )].slipperiness
         return 1
 
     def apply_accel(self):
@@ -140,9 +139,13 @@ class PhysicsPlugin(PluginBase):
         pos = self.pos + self.vec
         pos = collision.uncenter_position(pos, self.col.bbox)
         q = collections.deque((Vector3(),))
+        # Block bounding boxes fetched so far this tick
+        boxes = {}
         while q:
             current_vector = q.popleft()
-            transform_vectors = self.col.check_collision(pos, current_vector)
+            transform_vectors = self.col.check_collision(
+                pos, current_vector, boxes
+            )
             if not all(transform_vectors):
                 break
             for vector in transform_vectors:
@@ -156,7 +159,9 @@ class PhysicsPlugin(PluginBase):
         possible_mtv = [current_vector]
         while q:
             current_vector = q.popleft()
-            transform_vectors = self.col.check_collision(pos, current_vector)
+            transform_vectors = self.col.check_collision(
+                pos, current_vector, boxes
+            )
             if not all(transform_vectors):
                 possible_mtv.append(current_vector)
         return min(possible_mtv)
@@ -5,14 +5,19 @@ interpret blocks and their metadata more comprehensively. Planned to provide
 light level interpretation based on sky light and time of day
 """
 
+import logging
+
 from spockbot.mcdata import constants as const
 from spockbot.plugins.base import PluginBase, pl_announce
 from spockbot.plugins.tools import smpmap
 
+logger = logging.getLogger('spockbot')
+
 
 class WorldData(smpmap.Dimension):
-    def __init__(self, dimension=const.SMP_OVERWORLD):
-        super(WorldData, self).__init__(dimension)
+    def __init__(self, dimension=const.SMP_OVERWORLD,
+                 block_data_type=smpmap.ChunkDataShort):
+        super(WorldData, self).__init__(dimension, block_data_type)
         self.age = 0
         self.time_of_day = 0
 
@@ -21,10 +26,10 @@ class WorldData(smpmap.Dimension):
         self.time_of_day = data['time_of_day']
 
     def new_dimension(self, dimension):
-        super(WorldData, self).__init__(dimension)
+        super(WorldData, self).__init__(dimension, self.block_data_type)
 
     def reset(self):
-        self.__init__(self.dimension)
+        self.__init__(self.dimension, self.block_data_type)
 
 
 @pl_announce('World')
@@ -40,10 +45,20 @@ class WorldPlugin(PluginBase):
         'PLAY<Map Chunk Bulk': 'handle_map_chunk_bulk',
         'net_disconnect': 'handle_disconnect',
     }
+    defaults = {
+        'use_numpy': False,
+    }
 
     def __init__(self, ploader, settings):
         super(WorldPlugin, self).__init__(ploader, settings)
-        self.world = WorldData()
+        block_data_type = smpmap.ChunkDataShort
+        if self.settings['use_numpy']:
+            if smpmap.numpy is None:
+                logger.warning('WORLDPLUGIN: numpy is not installed, '
+                               'falling back to array based block storage')
+            else:
+                block_data_type = smpmap.ChunkDataShortNumpy
+        self.world = WorldData(block_data_type=block_data_type)
         ploader.provides('World', self.world)
 
     # Time Update - Update World Time
@@ -16,6 +16,8 @@ class PluginLoader(object):
         self.announce = {}
         self.extensions = {}
         self.events = []
+        # Shared by clients that run in one process, see plugins.runtime
+        self.runtime = kwargs.get('runtime')
         kwargs.get('settings_mixin', SettingsPlugin)(self, kwargs)
         self.fetch = self.requires('PloaderFetch')
         self.plugins = self.fetch.get_plugins()
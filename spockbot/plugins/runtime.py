@@ -0,0 +1,83 @@
+"""
+Runs many clients in one process on a shared event loop
+
+Every client keeps its own plugins and state. The runtime ticks their event
+cores in turn and then waits on one poller for the sockets of all of them,
+until the earliest timer of any client is due::
+
+    runtime = Runtime()
+    for username in usernames:
+        client = Client(runtime=runtime,
+                        settings={'start': {'username': username}})
+        client.start(host, port)
+    runtime.run()
+"""
+import logging
+import signal
+
+from spockbot.plugins.core.net import get_poller
+
+logger = logging.getLogger('spockbot')
+
+
+class Runtime(object):
+    def __init__(self, poller=None):
+        self.kill_event = False
+        self.event_cores = []
+        self.timer_cores = []
+        self.poller = self.make_poller(poller)
+        self.reg_signals()
+
+    def make_poller(self, poller):
+        # Shared by every client, see net.get_poller()
+        return get_poller(poller)
+
+    def reg_signals(self):
+        signal.signal(signal.SIGINT, self.kill)
+        signal.signal(signal.SIGTERM, self.kill)
+
+    def add_event_core(self, event):
+        event.emit('event_start')
+        self.event_cores.append(event)
+
+    def reg_timers(self, timer_core):
+        self.timer_cores.append(timer_core)
+
+    def unreg_timers(self, timer_core):
+        self.timer_cores.remove(timer_core)
+
+    def get_timeout(self):
+        # Clients killed during the last round get their event_kill right away
+        if any(event.kill_event for event in self.event_cores):
+            return 0
+        timeout = -1
+        for timer_core in self.timer_cores:
+            t = timer_core.get_timeout()
+            if t >= 0 and (timeout < 0 or t < timeout):
+                timeout = t
+        return timeout
+
+    def run_round(self):
+        """ Tick every client once, returns False once all have shut down """
+        # Clients added by handlers during this round start ticking
+        # in the next one
+        event_cores, self.event_cores = self.event_cores, []
+        alive = []
+        for event in event_cores:
+            if self.kill_event:
+                event.kill()
+            if event.kill_event:
+                event.emit('event_kill')
+            else:
+                event.emit('event_tick')
+                alive.append(event)
+        self.event_cores = alive + self.event_cores
+        return bool(self.event_cores)
+
+    def run(self):
+        while self.event_cores and self.run_round():
+            self.poller.poll(self.get_timeout())
+        logger.debug('RUNTIME: All clients shut down')
+
+    def kill(self, *args):
+        self.kill_event = True
@@ -1,3 +1,5 @@
+import math
+
 from spockbot.mcdata import blocks
 from spockbot.vector import Vector3
 
@@ -21,13 +23,19 @@ def gen_block_set(block_pos, xr=(-1, 2), yr=(0, 3), zr=(-1, 2)):
     return (pos + Vector3(*offset) for offset in offsets)
 
 
-# Axis must be a normalized/unit vector
-def check_axis(axis, min_a, max_a, min_b, max_b):
+def axis_overlap(min_a, max_a, min_b, max_b):
     l_dif = (max_b - min_a)
     r_dif = (max_a - min_b)
     if l_dif < 0 or r_dif < 0:
         return None
-    overlap = l_dif if l_dif <= r_dif else -r_dif
+    return l_dif if l_dif <= r_dif else -r_dif
+
+
+# Axis must be a normalized/unit vector
+def check_axis(axis, min_a, max_a, min_b, max_b):
+    overlap = axis_overlap(min_a, max_a, min_b, max_b)
+    if overlap is None:
+        return None
     return axis*overlap
 
 
@@ -36,27 +44,49 @@ class MTVTest(object):
         self.world = world
         self.bbox = bbox
 
-    def check_collision(self, pos, vector):
+    def check_collision(self, pos, vector, boxes=None):
         test_pos = pos + vector
-        return self.block_collision(test_pos)
-
-    def block_collision(self, pos):
-        for block_pos in gen_block_set(pos):
-            block_id, meta = self.world.get_block(
-                block_pos.x, block_pos.y, block_pos.z
-            )
-            block = blocks.get_block(block_id, meta)
-            if not block.bounding_box:
-                continue
-            transform_vectors = []
-            for i, axis in enumerate(UNIT_VECTORS):
-                axis_pen = check_axis(
-                    axis, pos[i], pos[i] + self.bbox[i],
-                    block_pos[i], block_pos[i] + block.bounding_box[i]
-                )
-                if not axis_pen:
-                    break
-                transform_vectors.append(axis_pen)
-            else:
-                return transform_vectors
+        return self.block_collision(test_pos, boxes)
+
+    def get_box(self, x, y, z, boxes):
+        # Far corner of the block's bounding box, or None if it has none
+        if (x, y, z) in boxes:
+            return boxes[(x, y, z)]
+        bbox = blocks.block_states[self.world.get_block_data(x, y, z)] \
+            .bounding_box
+        box = (x + bbox.x, y + bbox.y, z + bbox.z) if bbox else None
+        boxes[(x, y, z)] = box
+        return box
+
+    def block_collision(self, pos, boxes=None):
+        """
+        Tests against the blocks of gen_block_set(pos). boxes caches the
+        block bounding boxes by block position, pass the same dict to test
+        several positions against an unchanged world
+        """
+        if boxes is None:
+            boxes = {}
+        min_x, min_y, min_z = pos.x, pos.y, pos.z
+        max_x, max_y, max_z = (min_x + self.bbox.x, min_y + self.bbox.y,
+                               min_z + self.bbox.z)
+        bx = int(math.floor(min_x))
+        by = int(math.floor(min_y))
+        bz = int(math.floor(min_z))
+        for x in range(bx - 1, bx + 2):
+            for y in range(by, by + 3):
+                for z in range(bz - 1, bz + 2):
+                    box = self.get_box(x, y, z, boxes)
+                    if box is None:
+                        continue
+                    dx = axis_overlap(min_x, max_x, x, box[0])
+                    if not dx:
+                        continue
+                    dy = axis_overlap(min_y, max_y, y, box[1])
+                    if not dy:
+                        continue
+                    dz = axis_overlap(min_z, max_z, z, box[2])
+                    if not dz:
+                        continue
+                    return [Vector3(dx, 0, 0), Vector3(0, dy, 0),
+                            Vector3(0, 0, dz)]
         return [Vector3()]*3
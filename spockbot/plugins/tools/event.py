@@ -1,2 +1,12 @@
-"""Used for unregistering event handlers"""
+"""Used for unregistering event handlers and marking handlers that need
+their own copy of the event data"""
 EVENT_UNREGISTER = 0x1
+
+
+def copy_event_data(handler):
+    """
+    Event data is shared between all handlers of an event and must not be
+    modified. Handlers decorated with this get a deep copy of it instead.
+    """
+    handler.copy_event_data = True
+    return handler
@@ -14,12 +14,22 @@ ex.
 [256]-[511] are X = 0-15, Z = 0-15, Y = 1
 and so on
 
+The bulk queries on Dimension (get_blocks, get_region, find_blocks) need
+numpy, and so does the optional numpy backed block store
 """
 
 import array
+import collections
+import functools
+import heapq
 
 from spockbot.mcp.bbuff import BoundBuffer
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 DIMENSION_NETHER = -0x01
 DIMENSION_OVERWOLD = 0x00
 DIMENSION_END = 0x01
@@ -36,14 +46,17 @@ class ChunkData(object):
 
     def fill(self):
         if not self.data:
-            self.data = array.array(self.ty, [0] * self.length)
+            self.data = array.array(self.ty, b'\x00' * self.length)
 
     def unpack(self, buff):
         self.data = array.array(self.ty, buff.read(self.length))
 
     def pack(self):
         self.fill()
-        return self.data.tobytes()
+        try:
+            return self.data.tobytes()
+        except AttributeError:  # Python 2 array.array
+            return self.data.tostring()
 
     def get(self, x, y, z):
         self.fill()
@@ -74,6 +87,25 @@ class ChunkDataShort(ChunkData):
     ty = 'H'
 
 
+class ChunkDataShortNumpy(ChunkDataShort):
+    """ ChunkDataShort backed by a flat numpy array. unpack() copies the
+    section out of the packet data, so the packet buffer can be freed. """
+    dtype = '<u2'
+
+    def fill(self):
+        if self.data is None:
+            self.data = numpy.zeros(self.length // 2, self.dtype)
+
+    def unpack(self, buff):
+        # Python 2 numpy can't frombuffer() a memoryview, asarray() can
+        view = numpy.asarray(buff.read_view(self.length))
+        self.data = view.view(self.dtype).copy()
+
+    def get(self, x, y, z):
+        self.fill()
+        return self.data.item(x + ((y * 16) + z) * 16)
+
+
 class ChunkDataNibble(ChunkData):
     """ A 16x16x8 array for storing metadata, light or add. Each array element
     contains two 4-bit elements. """
@@ -96,14 +128,69 @@ class ChunkDataNibble(ChunkData):
 
 
 class Chunk(object):
-    def __init__(self):
-        self.block_data = ChunkDataShort()
+    def __init__(self, block_data_type=ChunkDataShort):
+        self.block_data = block_data_type()
         self.light_block = ChunkDataNibble()
         self.light_sky = ChunkDataNibble()
+        # block id: number of blocks in this chunk, None until first needed
+        self.block_counts = None
+
+    def get_block_counts(self):
+        if self.block_counts is None:
+            data = self.block_data.data
+            if data is None:
+                self.block_counts = {0: 4096}
+            elif numpy is not None:
+                counts = numpy.bincount(numpy.asarray(data) >> 4)
+                self.block_counts = {
+                    block_id: count
+                    for block_id, count in enumerate(counts.tolist()) if count
+                }
+            else:
+                self.block_counts = dict(
+                    collections.Counter(d >> 4 for d in data)
+                )
+        return self.block_counts
+
+    def set_block(self, x, y, z, data):
+        counts = self.block_counts
+        if counts is not None:
+            old_id = self.block_data.get(x, y, z) >> 4
+            counts[old_id] -= 1
+            if not counts[old_id]:
+                del counts[old_id]
+            counts[data >> 4] = counts.get(data >> 4, 0) + 1
+        self.block_data.set(x, y, z, data)
+
+    def block_positions(self, block_ids, meta=None):
+        """ (x, y, z) of every block in this chunk with one of the given
+        ids, relative to the chunk """
+        counts = self.get_block_counts()
+        block_ids = [i for i in block_ids if i in counts]
+        if not block_ids or self.block_data.data is None:
+            return []
+        if meta is None:
+            wanted = set(block_ids)
+        else:
+            wanted = set((i << 4) | meta for i in block_ids)
+        if numpy is not None:
+            data = numpy.asarray(self.block_data.data)
+            if meta is None:
+                data = data >> 4
+            indexes = numpy.flatnonzero(numpy.in1d(data, list(wanted)))
+            indexes = indexes.tolist()
+        elif meta is None:
+            indexes = (i for i, d in enumerate(self.block_data.data)
+                       if d >> 4 in wanted)
+        else:
+            indexes = (i for i, d in enumerate(self.block_data.data)
+                       if d in wanted)
+        return [(i & 0x0F, i >> 8, (i >> 4) & 0x0F) for i in indexes]
 
 
 class ChunkColumn(object):
-    def __init__(self):
+    def __init__(self, block_data_type=ChunkDataShort):
+        self.block_data_type = block_data_type
         self.chunks = [None] * 16
         self.biome = BiomeData()
 
@@ -113,8 +200,9 @@ class ChunkColumn(object):
         chunk_idx = [i for i in range(16) if mask & (1 << i)]
         for i in chunk_idx:
             if self.chunks[i] is None:
-                self.chunks[i] = Chunk()
+                self.chunks[i] = Chunk(self.block_data_type)
             self.chunks[i].block_data.unpack(buff)
+            self.chunks[i].block_counts = None
         for i in chunk_idx:
             self.chunks[i].light_block.unpack(buff)
         if skylight:
@@ -124,11 +212,28 @@ class ChunkColumn(object):
             self.biome.unpack(buff)
 
 
+def block_array(chunk):
+    """ The block data of a chunk as a (y, z, x) numpy array. """
+    chunk.block_data.fill()
+    return numpy.asarray(chunk.block_data.data).reshape(16, 16, 16)
+
+
+def needs_numpy(fn):
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        if numpy is None:
+            raise ImportError('%s requires numpy' % fn.__name__)
+        return fn(*args, **kwargs)
+
+    return inner
+
+
 class Dimension(object):
     """ A bunch of ChunkColumns. """
 
-    def __init__(self, dimension):
+    def __init__(self, dimension, block_data_type=ChunkDataShort):
         self.dimension = dimension
+        self.block_data_type = block_data_type
         self.columns = {}  # chunk columns are address by a tuple (x, z)
 
     def unpack_bulk(self, data):
@@ -137,7 +242,7 @@ class Dimension(object):
         for meta in data['metadata']:
             key = meta['chunk_x'], meta['chunk_z']
             if key not in self.columns:
-                self.columns[key] = ChunkColumn()
+                self.columns[key] = ChunkColumn(self.block_data_type)
             self.columns[key].unpack(bbuff, meta['primary_bitmap'], skylight)
 
     def unpack_column(self, data):
@@ -145,24 +250,28 @@ class Dimension(object):
         skylight = True if self.dimension == DIMENSION_OVERWOLD else False
         key = data['chunk_x'], data['chunk_z']
         if key not in self.columns:
-            self.columns[key] = ChunkColumn()
+            self.columns[key] = ChunkColumn(self.block_data_type)
         self.columns[key].unpack(
             bbuff, data['primary_bitmap'], skylight, data['continuous']
         )
 
     def get_block(self, x, y, z):
+        data = self.get_block_data(x, y, z)
+        return data >> 4, data & 0x0F
+
+    def get_block_data(self, x, y, z):
+        """ Raw (id << 4) | meta block data, see blocks.block_states """
         x, y, z = int(x), int(y), int(z)  # Damn you python2
         x, rx = divmod(x, 16)
         y, ry = divmod(y, 16)
         z, rz = divmod(z, 16)
 
-        if (x, z) not in self.columns or y > 0x0F:
-            return 0, 0
+        if (x, z) not in self.columns or not 0 <= y <= 0x0F:
+            return 0
         chunk = self.columns[(x, z)].chunks[y]
         if chunk is None:
-            return 0, 0
-        data = chunk.block_data.get(rx, ry, rz)
-        return data >> 4, data & 0x0F
+            return 0
+        return chunk.block_data.get(rx, ry, rz)
 
     def set_block(self, x, y, z, block_id=None, meta=None, data=None):
         x, rx = divmod(x, 16)
@@ -174,16 +283,16 @@ class Dimension(object):
         if (x, z) in self.columns:
             column = self.columns[(x, z)]
         else:
-            column = ChunkColumn()
+            column = ChunkColumn(self.block_data_type)
             self.columns[(x, z)] = column
         chunk = column.chunks[y]
         if chunk is None:
-            chunk = Chunk()
+            chunk = Chunk(self.block_data_type)
             column.chunks[y] = chunk
 
         if data is None:
             data = (block_id << 4) | (meta & 0x0F)
-        chunk.block_data.set(rx, ry, rz, data)
+        chunk.set_block(rx, ry, rz, data)
 
     def get_light(self, x, y, z):
         x, rx = divmod(x, 16)
@@ -208,11 +317,11 @@ class Dimension(object):
         if (x, z) in self.columns:
             column = self.columns[(x, z)]
         else:
-            column = ChunkColumn()
+            column = ChunkColumn(self.block_data_type)
             self.columns[(x, z)] = column
         chunk = column.chunks[y]
         if chunk is None:
-            chunk = Chunk()
+            chunk = Chunk(self.block_data_type)
             column.chunks[y] = chunk
 
         if light_block is not None:
@@ -236,7 +345,151 @@ class Dimension(object):
         if (x, z) in self.columns:
             column = self.columns[(x, z)]
         else:
-            column = ChunkColumn()
+            column = ChunkColumn(self.block_data_type)
             self.columns[(x, z)] = column
 
         return column.biome.set(rx, rz, data)
+
+    def get_snapshot(self, x0, y0, z0, x1, y1, z1):
+        """ Compact, picklable copy of the block data of every loaded chunk
+        touching the box between (x0, y0, z0) and (x1, y1, z1) inclusive,
+        as a dict of (cx, cy, cz): packed block data """
+        sections = {}
+        for cx in range(x0 >> 4, (x1 >> 4) + 1):
+            for cz in range(z0 >> 4, (z1 >> 4) + 1):
+                column = self.columns.get((cx, cz))
+                if column is None:
+                    continue
+                for cy in range(max(y0, 0) >> 4, (min(y1, 255) >> 4) + 1):
+                    chunk = column.chunks[cy]
+                    if chunk is not None and \
+                            chunk.block_data.data is not None:
+                        sections[(cx, cy, cz)] = chunk.block_data.pack()
+        return sections
+
+    def load_snapshot(self, sections):
+        for (cx, cy, cz), data in sections.items():
+            if (cx, cz) not in self.columns:
+                self.columns[(cx, cz)] = ChunkColumn(self.block_data_type)
+            chunk = Chunk(self.block_data_type)
+            chunk.block_data.unpack(BoundBuffer(data))
+            self.columns[(cx, cz)].chunks[cy] = chunk
+
+    def get_section(self, cx, cy, cz):
+        if (cx, cz) not in self.columns or not 0 <= cy <= 0x0F:
+            return None
+        return self.columns[(cx, cz)].chunks[cy]
+
+    @needs_numpy
+    def get_blocks(self, xs, ys, zs):
+        """ Vectorized get_block. Takes sequences of block coordinates and
+        returns numpy arrays of block ids and metadata. """
+        xs, ys, zs = numpy.broadcast_arrays(
+            *[numpy.asarray(c).astype(numpy.int64) for c in (xs, ys, zs)]
+        )
+        data = numpy.zeros(xs.shape, numpy.uint16)
+        cxs, cys, czs = xs >> 4, ys >> 4, zs >> 4
+        index = ys & 0x0F, zs & 0x0F, xs & 0x0F
+        valid = (ys >= 0) & (ys < 256)
+        sections = set(zip(
+            cxs[valid].tolist(), cys[valid].tolist(), czs[valid].tolist()
+        ))
+        for cx, cy, cz in sections:
+            chunk = self.get_section(cx, cy, cz)
+            if chunk is None:
+                continue
+            mask = valid & (cxs == cx) & (cys == cy) & (czs == cz)
+            data[mask] = block_array(chunk)[tuple(i[mask] for i in index)]
+        return data >> 4, data & 0x0F
+
+    @needs_numpy
+    def get_region(self, x0, y0, z0, x1, y1, z1):
+        """ Block ids and metadata for the box from (x0, y0, z0) up to but
+        not including (x1, y1, z1), as numpy arrays indexed [y, z, x]. """
+        data = numpy.zeros((y1 - y0, z1 - z0, x1 - x0), numpy.uint16)
+        for cy in range(max(y0, 0) >> 4, ((min(y1, 256) - 1) >> 4) + 1):
+            for cz in range(z0 >> 4, ((z1 - 1) >> 4) + 1):
+                for cx in range(x0 >> 4, ((x1 - 1) >> 4) + 1):
+                    chunk = self.get_section(cx, cy, cz)
+                    if chunk is None:
+                        continue
+                    # Overlap of the box and this section, in world coords
+                    lo = max(y0, cy * 16), max(z0, cz * 16), max(x0, cx * 16)
+                    hi = (min(y1, cy * 16 + 16), min(z1, cz * 16 + 16),
+                          min(x1, cx * 16 + 16))
+                    base = cy * 16, cz * 16, cx * 16
+                    origin = y0, z0, x0
+                    dst = tuple(slice(a - o, b - o)
+                                for a, b, o in zip(lo, hi, origin))
+                    src = tuple(slice(a - o, b - o)
+                                for a, b, o in zip(lo, hi, base))
+                    data[dst] = block_array(chunk)[src]
+        return data >> 4, data & 0x0F
+
+    @needs_numpy
+    def find_blocks(self, block_id, meta=None):
+        """ Positions of every loaded block with the given id (and metadata,
+        if given) as an (n, 3) numpy array of x, y, z. """
+        found = []
+        for (cx, cz), column in self.columns.items():
+            for cy, chunk in enumerate(column.chunks):
+                if chunk is None or chunk.block_data.data is None:
+                    continue
+                data = block_array(chunk).ravel()
+                if meta is None:
+                    hits = numpy.flatnonzero((data >> 4) == block_id)
+                else:
+                    hits = numpy.flatnonzero(data == ((block_id << 4) | meta))
+                if hits.size:
+                    found.append(numpy.column_stack((
+                        (hits & 0x0F) + cx * 16,
+                        (hits >> 8) + cy * 16,
+                        ((hits >> 4) & 0x0F) + cz * 16,
+                    )))
+        if not found:
+            return numpy.zeros((0, 3), numpy.int64)
+        return numpy.concatenate(found)
+
+    def nearest_blocks(self, x, y, z, block_ids, count=1, meta=None,
+                       max_dist=None):
+        """ Up to count (x, y, z) positions of loaded blocks with one of
+        block_ids (an id or a sequence of ids), nearest first.
+
+        Only chunks whose block counts contain one of the ids are searched,
+        in order of distance, so most of the loaded world is never scanned.
+        """
+        if isinstance(block_ids, int):
+            block_ids = (block_ids,)
+        limit = float('inf') if max_dist is None else max_dist ** 2
+        candidates = []
+        for (cx, cz), column in self.columns.items():
+            for cy, chunk in enumerate(column.chunks):
+                if chunk is None:
+                    continue
+                counts = chunk.get_block_counts()
+                if not any(block_id in counts for block_id in block_ids):
+                    continue
+                # Squared distance from x, y, z to the chunk's bounds
+                dist = sum(
+                    max(lo - p, 0, p - lo - 16) ** 2 for p, lo in
+                    ((x, cx * 16), (y, cy * 16), (z, cz * 16))
+                )
+                if dist <= limit:
+                    candidates.append((dist, cx, cy, cz))
+        candidates.sort()
+        best = []  # heap of (-dist, position) holding the closest found
+        for chunk_dist, cx, cy, cz in candidates:
+            if len(best) == count and chunk_dist > -best[0][0]:
+                break
+            chunk = self.columns[(cx, cz)].chunks[cy]
+            for rx, ry, rz in chunk.block_positions(block_ids, meta):
+                pos = cx * 16 + rx, cy * 16 + ry, cz * 16 + rz
+                dist = ((pos[0] + 0.5 - x) ** 2 + (pos[1] + 0.5 - y) ** 2 +
+                        (pos[2] + 0.5 - z) ** 2)
+                if dist > limit:
+                    continue
+                if len(best) < count:
+                    heapq.heappush(best, (-dist, pos))
+                elif dist < -best[0][0]:
+                    heapq.heapreplace(best, (-dist, pos))
+        return [pos for dist, pos in sorted(best, reverse=True)]
@@ -1,9 +1,16 @@
 from __future__ import division
 
+import abc
 import math
 
+import six
+
 
 class BaseVector(object):
+    """
+    Subclasses declare the slots they store their coordinates in
+    """
+    __slots__ = ()
     _internal_vec_type = list
 
     def __init__(self, *values):
@@ -32,7 +39,9 @@ class BaseVector(object):
         return len(self.vector)
 
 
-class CartesianVector(BaseVector):
+class BaseCartesianVector(BaseVector):
+    __slots__ = ()
+
     # Math operations
     # Is __abs__ really useful ?
     def __abs__(self):
@@ -146,46 +155,165 @@ class CartesianVector(BaseVector):
         return all(s == o for s, o in zip(self, other))
 
 
-class Vector3(CartesianVector):
+@six.add_metaclass(abc.ABCMeta)
+class CartesianVector(BaseCartesianVector):
+    """
+    Keeps its coordinates in the vector list. Vector3 keeps them in slots of
+    its own, so it only derives from BaseCartesianVector, and is registered
+    to still count as a CartesianVector
+    """
+    __slots__ = ('vector',)
+
+
+class Vector3(BaseCartesianVector):
+    """
+    x, y and z are stored in slots and the common operations are written out
+    per component, Vector3s are created in bulk by physics and pathfinding.
+    The vector attribute is a list copy of the coordinates
+    """
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, *xyz):
-        l = len(xyz)
-        if l == 1:
+        if len(xyz) == 3:
+            self.x, self.y, self.z = xyz
+        elif len(xyz) == 1:
             obj = xyz[0]
-            xyz = obj.x, obj.y, obj.z
-        elif l == 0:
-            xyz = (0, 0, 0)
-        elif l != 3:
-            raise ValueError('Wrong length: expected 3, got %s' % xyz)
-        super(Vector3, self).__init__(*xyz)
+            self.x, self.y, self.z = obj.x, obj.y, obj.z
+        elif not xyz:
+            self.x = self.y = self.z = 0
+        else:
+            raise ValueError('Wrong length: expected 3, got %s' % (xyz,))
 
     def init(self, *args):
         Vector3.__init__(self, *args)
         return self
 
-    # Some shortcuts
     @property
-    def x(self):
-        return self.vector[0]
+    def vector(self):
+        return [self.x, self.y, self.z]
 
-    @x.setter
-    def x(self, value):
-        self.vector[0] = value
+    @vector.setter
+    def vector(self, value):
+        self.x, self.y, self.z = value
 
-    @property
-    def y(self):
-        return self.vector[1]
+    def __iter__(self):
+        return iter((self.x, self.y, self.z))
 
-    @y.setter
-    def y(self, value):
-        self.vector[1] = value
+    def __getitem__(self, item):
+        return (self.x, self.y, self.z)[item]
 
-    @property
-    def z(self):
-        return self.vector[2]
+    def __setitem__(self, key, value):
+        setattr(self, ('x', 'y', 'z')[key], value)
+
+    def __len__(self):
+        return 3
+
+    def __abs__(self):
+        return self.__class__(abs(self.x), abs(self.y), abs(self.z))
+
+    def __add__(self, other):
+        if not isinstance(other, Vector3):
+            other = Vector3(*other)
+        return self.__class__(
+            self.x + other.x, self.y + other.y, self.z + other.z
+        )
+
+    def __iadd__(self, other):
+        if not isinstance(other, Vector3):
+            other = Vector3(*other)
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+
+    iadd = __iadd__
+
+    def __neg__(self):
+        return self.__class__(-self.x, -self.y, -self.z)
+
+    def __sub__(self, other):
+        if not isinstance(other, Vector3):
+            other = Vector3(*other)
+        return self.__class__(
+            self.x - other.x, self.y - other.y, self.z - other.z
+        )
+
+    def __isub__(self, other):
+        if not isinstance(other, Vector3):
+            other = Vector3(*other)
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+
+    isub = __isub__
 
-    @z.setter
-    def z(self, value):
-        self.vector[2] = value
+    def __mul__(self, other):
+        return self.__class__(self.x * other, self.y * other, self.z * other)
+
+    def __imul__(self, other):
+        self.x *= other
+        self.y *= other
+        self.z *= other
+        return self
+
+    imul = __imul__
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self.__class__(self.x / other, self.y / other, self.z / other)
+
+    def __itruediv__(self, other):
+        self.x /= other
+        self.y /= other
+        self.z /= other
+        return self
+
+    itruediv = __itruediv__
+    __div__ = __truediv__
+    __idiv__ = __itruediv__
+    idiv = __idiv__
+
+    def zero(self):
+        self.x = self.y = self.z = 0
+
+    def ifloor(self):
+        self.x = int(math.floor(self.x))
+        self.y = int(math.floor(self.y))
+        self.z = int(math.floor(self.z))
+        return self
+
+    def floor(self):
+        return self.__class__(int(math.floor(self.x)),
+                              int(math.floor(self.y)),
+                              int(math.floor(self.z)))
+
+    def dot_product(self, other):
+        return self.x * other[0] + self.y * other[1] + self.z * other[2]
+
+    def dist_sq(self, other=None):
+        """ For fast length comparison """
+        if other:
+            x, y, z = self.x - other[0], self.y - other[1], self.z - other[2]
+        else:
+            x, y, z = self.x, self.y, self.z
+        return x * x + y * y + z * z
+
+    def dist(self, other=None):
+        return math.sqrt(self.dist_sq(other))
+
+    def __bool__(self):
+        return bool(self.x or self.y or self.z)
+    __nonzero__ = __bool__
+
+    def __hash__(self):
+        return hash((self.x, self.y, self.z))
+
+    def __eq__(self, other):
+        if isinstance(other, Vector3):
+            return self.x == other.x and self.y == other.y \
+                and self.z == other.z
+        return super(Vector3, self).__eq__(other)
 
     @property
     def yaw_pitch(self):
@@ -215,18 +343,22 @@ class Vector3(CartesianVector):
         return YawPitch(yaw, pitch)
 
     def set_dict(self, data):
-        self.vector[0] = data['x']
-        self.vector[1] = data['y']
-        self.vector[2] = data['z']
+        self.x = data['x']
+        self.y = data['y']
+        self.z = data['z']
 
     def get_dict(self):
-        return {'x': self.vector[0], 'y': self.vector[1], 'z': self.vector[2]}
+        return {'x': self.x, 'y': self.y, 'z': self.z}
+
+
+CartesianVector.register(Vector3)
 
 
 class YawPitch(BaseVector):
     """
     Store the yaw and pitch (in degrees)
     """
+    __slots__ = ('vector',)
 
     def __init__(self, *args):
         assert len(args) == 2, 'Wrong length: expected 2, got %s' % args
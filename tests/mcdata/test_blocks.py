@@ -0,0 +1,24 @@
+from spockbot.mcdata import blocks
+
+
+def test_block_states_match_get_block():
+    for block_id, meta in ((0, 0), (1, 3), (85, 0), (64, 4), (64, 8)):
+        state = blocks.block_states[(block_id << 4) | meta]
+        block = blocks.get_block(block_id, meta)
+        assert type(state) is type(block)
+        assert state.metadata == meta
+        assert state.bounding_box == block.bounding_box
+        assert state.display_name == block.display_name
+
+
+def test_block_states_are_shared():
+    assert blocks.get_block_state(85, 0) is blocks.get_block_state(85, 0)
+    # Fence extension was applied
+    assert blocks.get_block_state(85, 0).bounding_box.y == 1.5
+    # Open and closed door
+    assert blocks.get_block_state(64, 4).bounding_box is None
+    assert blocks.get_block_state(64, 0).bounding_box.y == 2
+
+
+def test_unknown_block_state():
+    assert blocks.get_block_state(4000, 0) is None
@@ -0,0 +1,54 @@
+import pytest
+
+from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
+
+
+def test_read_write():
+    bbuff = BoundBuffer(b'abc')
+    bbuff.write(b'def')
+    assert len(bbuff) == 6
+    assert bbuff.read(2) == b'ab'
+    assert bbuff.tell() == 2
+    assert bbuff.flush() == b'cdef'
+    assert len(bbuff) == 0
+
+
+def test_underflow():
+    bbuff = BoundBuffer(b'abc')
+    with pytest.raises(BufferUnderflowException):
+        bbuff.read(4)
+    assert bbuff.read(3) == b'abc'
+
+
+def test_save_revert():
+    bbuff = BoundBuffer(b'abcdef')
+    bbuff.read(2)
+    bbuff.save()
+    assert bbuff.tell() == 0
+    bbuff.read(3)
+    bbuff.revert()
+    assert bbuff.tell() == 0
+    assert bbuff.read(4) == b'cdef'
+
+
+def test_compaction():
+    bbuff = BoundBuffer()
+    bbuff.compact_size = 4
+    bbuff.write(b'0123456789')
+    for i in range(10):
+        bbuff.save()
+        assert bbuff.read(1) == str(i).encode()
+        bbuff.write(b'x')
+    bbuff.save()
+    assert len(bbuff.buff) < 20
+    assert bbuff.flush() == b'x' * 10
+
+
+def test_read_view():
+    bbuff = BoundBuffer(b'abcdef')
+    view = bbuff.read_view(3)
+    # Growing the buffer must not invalidate or change the live view
+    bbuff.write(b'ghi')
+    bbuff.save()
+    assert view.tobytes() == b'abc'
+    assert bbuff.flush() == b'defghi'
@@ -0,0 +1,29 @@
+from spockbot.mcp import proto
+from spockbot.mcp.bbuff import BoundBuffer
+from spockbot.mcp.codec import PacketCodec, hashed_codecs
+from spockbot.mcp.proto import (MC_BOOL, MC_BYTE, MC_FP_INT, MC_STRING,
+                                MC_VARINT)
+
+
+def test_fixed_runs_are_merged():
+    codec = PacketCodec((
+        (MC_VARINT, 'eid'),
+        (MC_FP_INT, 'x'),
+        (MC_BYTE, 'yaw'),
+        (MC_BOOL, 'on_ground'),
+        (MC_STRING, 'name'),
+    ))
+    assert len(codec.decoders) == 3
+    assert len(codec.encoders) == 3
+
+
+def test_roundtrip():
+    ident = proto.packet_str2ident['PLAY<Entity Teleport']
+    codec = hashed_codecs[ident]
+    data = {
+        'eid': 300, 'x': 1.5, 'y': -64.25, 'z': 0.0,
+        'yaw': -12, 'pitch': 90, 'on_ground': True,
+    }
+    bbuff = BoundBuffer(codec.encode(data))
+    assert codec.decode(bbuff, {}) == data
+    assert len(bbuff) == 0
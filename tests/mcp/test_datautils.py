@@ -1,4 +1,7 @@
+import pytest
+
 from spockbot.mcp import datautils
+from spockbot.mcp.bbuff import BufferUnderflowException
 
 
 def test_unpack_varint():
@@ -27,3 +30,31 @@ def test_pack_varlong():
     assert datautils.pack_varlong(10000000000) == b'\x80\xc8\xaf\xa0%'
     assert datautils.pack_varlong(10000000000000000000) is None
     assert datautils.pack_varlong(-10000000000000000000) is None
+
+
+def test_varint_underflow():
+    bbuff = datautils.BoundBuffer(b'\x80\x94')
+    with pytest.raises(BufferUnderflowException):
+        datautils.unpack_varint(bbuff)
+
+
+def test_varint_round_trip():
+    for val in (0, 127, 128, 16383, 16384, -1, -(1 << 31), (1 << 31) - 1):
+        bbuff = datautils.BoundBuffer(datautils.pack_varint(val))
+        assert datautils.unpack_varint(bbuff) == val
+        assert len(bbuff) == 0
+
+
+def test_unpack_varints():
+    vals = [1, 300, -5, 1000000000]
+    bbuff = datautils.BoundBuffer(b''.join(
+        datautils.pack_varint(val) for val in vals
+    ) + b'\x01')
+    assert datautils.unpack_varints(bbuff, 4) == vals
+    assert bbuff.read(1) == b'\x01'
+
+
+def test_varlong_sign():
+    for val in (-1, -(1 << 63), (1 << 63) - 1, -10000000000):
+        bbuff = datautils.BoundBuffer(datautils.pack_varlong(val))
+        assert datautils.unpack_varlong(bbuff) == val
@@ -0,0 +1,92 @@
+import zlib
+
+import pytest
+
+from spockbot.mcp import datautils, proto
+from spockbot.mcp.bbuff import BoundBuffer
+from spockbot.mcp.mcpacket import Packet, PacketDecodeFailure, decompress
+from spockbot.mcp.proto import MC_VARINT
+
+
+def decode(data):
+    return Packet(ident=(proto.STATUS_STATE, proto.SERVER_TO_CLIENT)).decode(
+        BoundBuffer(data), proto.PROTO_COMP_ON
+    )
+
+
+def test_compressed_roundtrip():
+    response = {'response': 'x' * 300}
+    data = Packet('STATUS<Status Response', response).encode(
+        proto.PROTO_COMP_ON, 64
+    )
+    # Body length, not 0 as the packet is over the threshold
+    assert data[3:4] != b'\x00'
+    assert decode(data).data == response
+
+
+def test_below_threshold():
+    data = Packet('STATUS<Status Ping', {'time': 5}).encode(
+        proto.PROTO_COMP_ON, 64
+    )
+    assert data[1:2] == b'\x00'
+    assert decode(data).data == {'time': 5}
+
+
+def test_body_length_mismatch():
+    body = Packet('STATUS<Status Ping', {'time': 5}).encode(
+        proto.PROTO_COMP_OFF, -1
+    )[1:]
+    payload = datautils.pack(MC_VARINT, len(body) + 1) + zlib.compress(body)
+    with pytest.raises(PacketDecodeFailure):
+        decode(datautils.pack(MC_VARINT, len(payload)) + payload)
+
+
+def test_decompress_view():
+    data = memoryview(bytearray(zlib.compress(b'abc' * 100)))
+    assert decompress(data, 300) == b'abc' * 100
+    with pytest.raises(zlib.error):
+        decompress(data, 299)
+
+
+def zeros_stream(megabytes):
+    # A flushed block repeated, without compressing all of the zeros
+    deflate = zlib.compressobj()
+    zeros = b'\0' * (1 << 20)
+    head = deflate.compress(zeros) + deflate.flush(zlib.Z_FULL_FLUSH)
+    block = deflate.compress(zeros) + deflate.flush(zlib.Z_FULL_FLUSH)
+    return head + block * (megabytes - 1)
+
+
+def test_decompress_oversized():
+    data = zeros_stream(300)
+    with pytest.raises(zlib.error):
+        decompress(data, 10)
+    with pytest.raises(zlib.error):
+        decompress(data, 1 << 20)
+    # Stream ending a few bytes past the declared length
+    data = zlib.compress(b'abc' * 100)
+    for length in (297, 299):
+        with pytest.raises(zlib.error):
+            decompress(data, length)
+    assert decompress(data, 300) == b'abc' * 100
+
+
+def test_decompress_oversized_memory():
+    tracemalloc = pytest.importorskip('tracemalloc')
+    data = zeros_stream(300)
+    tracemalloc.start()
+    try:
+        with pytest.raises(zlib.error):
+            decompress(data, 10)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < 1 << 20
+
+
+def test_decompress_truncated():
+    if not hasattr(zlib.decompressobj(), 'eof'):
+        pytest.skip('Python 2 zlib cannot tell a stream was cut short')
+    data = zlib.compress(b'abc' * 100)
+    with pytest.raises(zlib.error):
+        decompress(data[:-4], 300)
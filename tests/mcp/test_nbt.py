@@ -0,0 +1,58 @@
+import pytest
+
+from spockbot.mcp import nbt
+from spockbot.mcp.bbuff import BoundBuffer, BufferUnderflowException
+
+
+def render(tag):
+    bbuff = BoundBuffer()
+    tag._render_buffer(bbuff)
+    return bbuff.flush()
+
+
+def make_compound():
+    comp = nbt.TagCompound()
+    comp['id'] = nbt.TagString('Chest')
+    comp['heights'] = nbt.TagIntArray()
+    comp['heights'].value = [1, -2, 1 << 30]
+    items = nbt.TagList(nbt.TagCompound)
+    for slot in range(3):
+        item = nbt.TagCompound()
+        item['Slot'] = nbt.TagByte(slot)
+        item['Damage'] = nbt.TagShort(-1)
+        items.append(item)
+    comp['Items'] = items
+    comp['Pos'] = nbt.TagList(nbt.TagDouble)
+    comp['Pos'].append(nbt.TagDouble(0.5))
+    return comp
+
+
+def test_lazy_compound():
+    data = render(make_compound())
+    bbuff = BoundBuffer(data + b'\x01')
+    comp = nbt.TagCompound(buffer=bbuff)
+    # Only the compound is consumed
+    assert bbuff.read(1) == b'\x01'
+    assert comp._raw == data
+    assert render(comp) == data
+    assert comp['id'].value == 'Chest'
+    assert comp._raw is None
+    assert list(comp['heights']) == [1, -2, 1 << 30]
+    assert [item['Slot'].value for item in comp['Items']] == [0, 1, 2]
+    assert comp['Items'][2]['Damage'].value == -1
+    assert comp['Pos'][0].value == 0.5
+    assert render(comp) == data
+
+
+def test_lazy_compound_modified():
+    comp = nbt.TagCompound(buffer=BoundBuffer(render(make_compound())))
+    comp['id'] = nbt.TagString('Furnace')
+    copy = nbt.TagCompound(buffer=BoundBuffer(render(comp)))
+    assert copy['id'].value == 'Furnace'
+    assert len(copy['Items']) == 3
+
+
+def test_lazy_compound_underflow():
+    data = render(make_compound())
+    with pytest.raises(BufferUnderflowException):
+        nbt.TagCompound(buffer=BoundBuffer(data[:-3]))
@@ -0,0 +1,127 @@
+from unittest import TestCase, skipIf
+
+from spockbot.mcp import proto
+from spockbot.plugins.base import PluginBase
+from spockbot.plugins.core.aionet import (
+    AsyncioNetPlugin, AsyncioRuntime, BaseProtocol, asyncio, asyncio_plugins
+)
+from spockbot.plugins.core.event import EventPlugin
+from spockbot.plugins.core.net import NetPlugin
+from spockbot.plugins.core.timers import TimersPlugin
+from spockbot.plugins.loader import PluginLoader
+
+from tests.plugins.test_runtime import CountdownPlugin
+
+
+class PingPlugin(PluginBase):
+    requires = ('Event', 'Net')
+    defaults = {
+        'port': None,
+    }
+    events = {
+        'event_start': 'handle_start',
+        'net_connect': 'handle_connect',
+        'STATUS<Status Ping': 'handle_pong',
+        'net_disconnect': 'handle_disconnect',
+    }
+
+    def __init__(self, ploader, settings):
+        super(PingPlugin, self).__init__(ploader, settings)
+        self.pongs = []
+        self.disconnects = []
+        ploader.ping = self
+
+    def handle_start(self, _, __):
+        self.net.connect('127.0.0.1', self.settings['port'])
+
+    def handle_connect(self, _, __):
+        self.net.set_proto_state(proto.STATUS_STATE)
+        self.net.push_packet('STATUS>Status Ping', {'time': 1})
+        self.net.push_packet('STATUS>Status Ping', {'time': 2})
+
+    def handle_pong(self, _, packet):
+        self.pongs.append(packet.data['time'])
+        if len(self.pongs) == 2:
+            self.event.kill()
+
+    def handle_disconnect(self, _, reason):
+        self.disconnects.append(reason)
+
+
+class EchoProtocol(BaseProtocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.transport.write(data)
+
+
+@skipIf(asyncio is None, 'needs asyncio')
+class AsyncioRuntimeTest(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.runtime = AsyncioRuntime(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def make_client(self, plugin, **settings):
+        return PluginLoader(runtime=self.runtime, plugins=[
+            ('event', EventPlugin),
+            ('timers', TimersPlugin),
+            ('net', AsyncioNetPlugin),
+            ('test', plugin),
+        ], test=settings)
+
+    def test_closed(self):
+        closed = self.runtime.closed
+        self.assertIsInstance(closed, asyncio.Future)
+        self.assertFalse(closed.done())
+        # Resolved once the last client is gone, a new client gets a new one
+        self.runtime.tick()
+        self.assertTrue(closed.done())
+        self.runtime.add_event_core(self.make_client(CountdownPlugin, runs=1)
+                                    .requires('Event'))
+        self.assertIsNot(self.runtime.closed, closed)
+        self.assertFalse(self.runtime.closed.done())
+
+    def test_timers(self):
+        clients = [self.make_client(CountdownPlugin, runs=runs)
+                   for runs in (2, 5)]
+        for client in clients:
+            client.requires('Event').event_loop()
+        self.runtime.run()
+        self.assertEqual([c.countdown.fired for c in clients], [2, 5])
+        self.assertEqual(self.runtime.timer_cores, [])
+
+    def test_connect(self):
+        server = self.loop.run_until_complete(
+            self.loop.create_server(EchoProtocol, '127.0.0.1', 0)
+        )
+        try:
+            port = server.sockets[0].getsockname()[1]
+            client = self.make_client(PingPlugin, port=port)
+            client.requires('Event').event_loop()
+            self.runtime.run()
+            self.assertEqual(client.ping.pongs, [1, 2])
+            self.assertIsNone(client.requires('Net').sock.transport)
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+
+    def test_connect_error(self):
+        server = self.loop.run_until_complete(
+            self.loop.create_server(EchoProtocol, '127.0.0.1', 0)
+        )
+        port = server.sockets[0].getsockname()[1]
+        server.close()
+        self.loop.run_until_complete(server.wait_closed())
+        client = self.make_client(PingPlugin, port=port)
+        client.requires('Event').event_loop()
+        self.runtime.run()
+        self.assertEqual(client.ping.pongs, [])
+        self.assertEqual(len(client.ping.disconnects), 1)
+
+    def test_asyncio_plugins(self):
+        plugins = dict(asyncio_plugins([('net', NetPlugin)]))
+        self.assertIs(plugins['net'], AsyncioNetPlugin)
@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from spockbot.plugins.core.event import EventCore
+from spockbot.plugins.tools.event import EVENT_UNREGISTER, copy_event_data
+
+
+class EventCoreTest(TestCase):
+    def setUp(self):
+        self.event = EventCore()
+        self.calls = []
+
+    def test_data_is_shared(self):
+        data = {'a': [1]}
+
+        def handler(event, d):
+            self.calls.append(d)
+        self.event.reg_event_handler('test', handler)
+        self.event.reg_event_handler('test', handler)
+        self.event.emit('test', data)
+        self.assertIs(self.calls[0], data)
+        self.assertIs(self.calls[1], data)
+
+    def test_copy_event_data(self):
+        data = {'a': [1]}
+
+        @copy_event_data
+        def handler(event, d):
+            d['a'].append(2)
+            self.calls.append(d)
+        self.event.reg_event_handler('test', handler)
+        self.event.emit('test', data)
+        self.assertIsNot(self.calls[0], data)
+        self.assertEqual(data, {'a': [1]})
+
+    def test_newest_handler_first(self):
+        self.event.reg_event_handler('test', lambda e, d: self.calls.append(1))
+        self.event.emit('test')
+        self.event.reg_event_handler('test', lambda e, d: self.calls.append(2))
+        self.event.emit('test')
+        self.assertEqual(self.calls, [1, 2, 1])
+
+    def test_unregister(self):
+        def handler(event, d):
+            self.calls.append(d)
+            return EVENT_UNREGISTER
+        self.event.reg_event_handler('test', handler)
+        self.event.emit('test', 1)
+        self.event.emit('test', 2)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.event.event_handlers['test'], [])
+
+    def test_register_during_emit(self):
+        def handler(event, d):
+            self.calls.append(d)
+            self.event.reg_event_handler('test', handler)
+        self.event.reg_event_handler('test', handler)
+        self.event.emit('test', 1)
+        self.assertEqual(self.calls, [1])
+        self.event.emit('test', 2)
+        self.assertEqual(self.calls, [1, 2, 2])
+
+    def test_emit_does_not_add_events(self):
+        self.event.emit('nobody_listens')
+        self.assertNotIn('nobody_listens', self.event.event_handlers)
@@ -0,0 +1,421 @@
+import socket
+import time
+from collections import defaultdict
+from unittest import TestCase, skipIf
+
+from spockbot.mcp import datautils, mcpacket, proto
+from spockbot.mcp.bbuff import BoundBuffer
+from spockbot.mcp.proto import MC_VARINT
+from spockbot.plugins.base import PluginBase
+from spockbot.plugins.core import net
+from spockbot.plugins.core.event import EventPlugin
+from spockbot.plugins.core.net import (
+    AESCipher, NetCore, NetPlugin, Resolver, SelectPoller, SelectSocket,
+    SelectorsPoller, selectors
+)
+from spockbot.plugins.core.timers import TimersPlugin
+from spockbot.plugins.loader import PluginLoader
+from spockbot.plugins.runtime import Runtime
+
+
+class EventMock(object):
+    def __init__(self):
+        self.event_handlers = defaultdict(list)
+        self.emitted = []
+
+    def emit(self, event, data=None):
+        self.emitted.append((event, data))
+
+
+class SocketMock(object):
+    sending = False
+
+
+def encode(ident, data):
+    return mcpacket.Packet(ident, data).encode(proto.PROTO_COMP_OFF, -1)
+
+
+class NetCoreTest(TestCase):
+    def setUp(self):
+        self.event = EventMock()
+        self.net = NetCore(SocketMock(), self.event, lazy_decode=True)
+        self.net.proto_state = proto.PLAY_STATE
+        self.stream = encode('PLAY<Keep Alive', {'keep_alive': 42})
+        self.stream += encode('PLAY<Time Update', {
+            'world_age': 1, 'time_of_day': 2,
+        })
+
+    def test_lazy_decode_skips_unhandled(self):
+        self.event.event_handlers['PLAY<Time Update'].append(None)
+        self.net.read_packet(self.stream)
+        emitted = [event for event, data in self.event.emitted]
+        self.assertNotIn('PLAY<Keep Alive', emitted)
+        self.assertIn('PLAY<Time Update', emitted)
+        self.assertEqual(len(self.net.rbuff), 0)
+
+    def test_lazy_decode_ident_handler(self):
+        ident = proto.packet_str2ident['PLAY<Keep Alive']
+        self.event.event_handlers[ident].append(None)
+        self.net.read_packet(self.stream)
+        packets = [data for event, data in self.event.emitted
+                   if event == 'PLAY<Keep Alive']
+        self.assertEqual(packets[0].data, {'keep_alive': 42})
+
+    def test_eager_decode(self):
+        self.net.lazy_decode = False
+        self.net.read_packet(self.stream)
+        emitted = [event for event, data in self.event.emitted]
+        self.assertIn('PLAY<Keep Alive', emitted)
+        self.assertIn('PLAY<Time Update', emitted)
+
+
+class SendSocketMock(SocketMock):
+    """ A socket without sendmsg that takes limit bytes per send """
+    def __init__(self, limit):
+        self.limit = limit
+        self.data = b''
+
+    def send(self, data):
+        data = memoryview(data)[:self.limit].tobytes()
+        self.data += data
+        return len(data)
+
+
+class SendQueueTest(TestCase):
+    def setUp(self):
+        self.event = EventMock()
+
+    def test_consume(self):
+        net = NetCore(SocketMock(), self.event)
+        for data in (b'abc', b'defg', b'h'):
+            net.queue_data(data)
+        self.assertEqual(net.queued, 8)
+        net.consume(5)
+        self.assertEqual(net.queued, 3)
+        self.assertEqual([memoryview(b).tobytes() for b in net.send_queue],
+                         [b'fg', b'h'])
+        net.consume(3)
+        self.assertEqual(len(net.send_queue), 0)
+
+    def test_high_water(self):
+        net = NetCore(SocketMock(), self.event, high_water=8)
+        net.queue_data(b'x' * 8)
+        self.assertEqual(self.event.emitted, [])
+        net.queue_data(b'x' * 4)
+        net.queue_data(b'x' * 4)
+        self.assertEqual(self.event.emitted, [('net_high_water', 12)])
+        net.consume(12)
+        self.assertEqual(self.event.emitted[1:], [])
+        net.consume(2)
+        self.assertEqual(self.event.emitted[1:], [('net_low_water', 2)])
+
+    def test_comp_threshold(self):
+        net = NetCore(SocketMock(), self.event, comp_threshold=1024)
+        net.set_comp_state(16)
+        net.push_packet('PLAY>Chat Message', {'message': 'x' * 100})
+        # Over the server's threshold, but under ours
+        self.assertEqual(bytes(net.send_queue[0][1:2]), b'\x00')
+        net.send_comp_threshold = -1
+        net.push_packet('PLAY>Chat Message', {'message': 'x' * 100})
+        self.assertNotEqual(bytes(net.send_queue[1][1:2]), b'\x00')
+
+    def test_send_joined(self):
+        sock = SendSocketMock(5)
+        net = NetCore(sock, self.event)
+        for data in (b'abc', b'defg', b'h'):
+            net.queue_data(data)
+        self.assertEqual(net.send(), 3)
+        self.assertEqual(net.send(), 0)
+        self.assertEqual(sock.data, b'abcdefgh')
+        self.assertEqual(net.send(), 0)
+
+    @skipIf(not hasattr(socket.socket, 'sendmsg'), 'needs sendmsg')
+    def test_sendmsg(self):
+        sock, peer = socket.socketpair()
+        try:
+            net = NetCore(sock, self.event)
+            for data in (b'abc', b'defg', b'h'):
+                net.queue_data(data)
+            self.assertEqual(net.send(), 0)
+            self.assertEqual(peer.recv(16), b'abcdefgh')
+        finally:
+            sock.close()
+            peer.close()
+
+
+class TimerMock(object):
+    def get_timeout(self):
+        return 0
+
+
+class PollerTest(TestCase):
+    def check_poller(self, poller):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        sock = SelectSocket(TimerMock())
+        sock.connect(server.getsockname())
+        conn, _ = server.accept()
+        try:
+            flags = []
+
+            def handler(name, data):
+                flags.append(name)
+            poller.register(sock, handler, handler, handler)
+            poller.poll(0)
+            self.assertEqual(flags, [])
+            conn.sendall(b'x')
+            sock.sending = True
+            poller.poll(1)
+            self.assertEqual(sorted(flags), ['SOCKET_RECV', 'SOCKET_SEND'])
+            self.assertFalse(sock.sending)
+            poller.unregister(sock)
+            self.assertIsNone(sock.poller)
+        finally:
+            conn.close()
+            sock.close()
+            server.close()
+
+    def test_select_poller(self):
+        self.check_poller(SelectPoller())
+
+    @skipIf(selectors is None, 'needs selectors')
+    def test_selectors_poller(self):
+        self.check_poller(SelectorsPoller())
+
+
+class ConnectPlugin(PluginBase):
+    requires = ('Event', 'Net')
+    defaults = {
+        'host': '127.0.0.1',
+        'port': None,
+    }
+    events = {
+        'event_start': 'handle_start',
+        'net_connect': 'handle_connect',
+        'net_disconnect': 'handle_disconnect',
+    }
+
+    def __init__(self, ploader, settings):
+        super(ConnectPlugin, self).__init__(ploader, settings)
+        self.connects = []
+        self.disconnects = []
+        ploader.connect = self
+
+    def handle_start(self, _, __):
+        self.net.connect(self.settings['host'], self.settings['port'])
+        self.connecting = self.net.connecting
+
+    def handle_connect(self, _, data):
+        self.connects.append(data)
+        self.event.kill()
+
+    def handle_disconnect(self, _, reason):
+        self.disconnects.append(reason)
+
+
+class PendingResolver(object):
+    def __init__(self, host, port):
+        self.done = False
+
+
+class ConnectTest(TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+    def run_client(self, **settings):
+        runtime = Runtime()
+        client = PluginLoader(runtime=runtime, plugins=[
+            ('event', EventPlugin),
+            ('timers', TimersPlugin),
+            ('net', NetPlugin),
+            ('connect', ConnectPlugin),
+        ], connect=settings, net={'connect_timeout': 0.2})
+        client.requires('Event').event_loop()
+        runtime.run()
+        return client.connect
+
+    def test_resolver(self):
+        resolver = Resolver('127.0.0.1', 25565)
+        self.assertTrue(resolver.done)
+        self.assertEqual(resolver.addr, ('127.0.0.1', 25565))
+        resolver = Resolver('localhost', self.port)
+        resolver.resolve()
+        self.assertEqual(resolver.addr[1], self.port)
+
+    def test_connect(self):
+        plugin = self.run_client(host='localhost', port=self.port)
+        self.assertTrue(plugin.connecting)
+        self.assertEqual(plugin.connects, [('localhost', self.port)])
+
+    def test_connect_refused(self):
+        self.server.close()
+        plugin = self.run_client(port=self.port)
+        self.assertEqual(plugin.connects, [])
+        self.assertEqual(len(plugin.disconnects), 1)
+
+    def test_connect_timeout(self):
+        resolver = net.Resolver
+        net.Resolver = PendingResolver
+        try:
+            plugin = self.run_client(host='example.invalid', port=self.port)
+        finally:
+            net.Resolver = resolver
+        self.assertEqual(plugin.connects, [])
+        self.assertIsInstance(plugin.disconnects[0], socket.timeout)
+
+
+class PluginLoaderMock(object):
+    def __init__(self):
+        self.event = EventMock()
+
+    def requires(self, ident):
+        return {'Event': self.event, 'Timers': TimerMock()}[ident]
+
+    def provides(self, ident, obj):
+        pass
+
+    def reg_event_handler(self, event, handler):
+        pass
+
+
+class RecvTest(TestCase):
+    def setUp(self):
+        self.ploader = PluginLoaderMock()
+        self.plugin = NetPlugin(self.ploader, {'bufsize': 16})
+        self.plugin.sock.close()
+        self.sock, self.peer = socket.socketpair()
+        self.sock.setblocking(False)
+        self.plugin.sock = self.plugin.net.sock = self.sock
+        self.plugin.net.connected = True
+        self.plugin.net.proto_state = proto.PLAY_STATE
+        self.stream = b''.join(
+            encode('PLAY<Keep Alive', {'keep_alive': i}) for i in range(200)
+        )
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def received(self):
+        return [data.data['keep_alive'] for event, data in
+                self.ploader.event.emitted if event == 'PLAY<Keep Alive']
+
+    def test_drain(self):
+        self.peer.sendall(self.stream)
+        self.plugin.handle_recv('SOCKET_RECV', None)
+        self.assertEqual(self.received(), list(range(200)))
+        self.assertGreater(len(self.plugin.recv_view), 16)
+        # Drained, nothing left to read
+        self.plugin.handle_recv('SOCKET_RECV', None)
+        self.assertEqual(len(self.received()), 200)
+
+    def test_encrypted(self):
+        key = b'k' * 16
+        self.plugin.net.enable_crypto(key)
+        self.peer.sendall(AESCipher(key).encrypt(self.stream))
+        self.plugin.handle_recv('SOCKET_RECV', None)
+        self.assertEqual(self.received(), list(range(200)))
+
+    def test_hup(self):
+        self.peer.sendall(self.stream)
+        self.peer.close()
+        # A short read ends the drain, the hang up is seen on the next one
+        self.plugin.handle_recv('SOCKET_RECV', None)
+        self.plugin.handle_recv('SOCKET_RECV', None)
+        self.assertEqual(len(self.received()), 200)
+        self.assertEqual(self.ploader.event.emitted[-1], ('SOCKET_HUP', None))
+
+
+class ReaderThreadTest(TestCase):
+    def setUp(self):
+        self.ploader = PluginLoaderMock()
+        self.plugin = NetPlugin(self.ploader, {
+            'bufsize': 16, 'reader_thread': True, 'reader_queue': 8,
+        })
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.plugin.sock.connect(server.getsockname())
+        self.peer = server.accept()[0]
+        server.close()
+        self.plugin.sock.setblocking(False)
+        self.plugin.net.connected = True
+        self.plugin.net.proto_state = proto.PLAY_STATE
+        self.plugin.handle_connect('net_connect', None)
+
+    def tearDown(self):
+        if self.plugin.reader is not None:
+            self.plugin.close_sock()
+        self.peer.close()
+
+    def received(self):
+        return [data.data['keep_alive'] for event, data in
+                self.ploader.event.emitted if event == 'PLAY<Keep Alive']
+
+    def poll_until(self, done):
+        deadline = time.time() + 5
+        while not done() and time.time() < deadline:
+            self.plugin.poller.poll(0.1)
+
+    def test_reader(self):
+        self.peer.sendall(b''.join(
+            encode('PLAY<Keep Alive', {'keep_alive': i}) for i in range(200)
+        ))
+        self.poll_until(lambda: len(self.received()) == 200)
+        self.assertEqual(self.received(), list(range(200)))
+        self.peer.close()
+        self.poll_until(lambda: self.ploader.event.emitted[-1][0] ==
+                        'SOCKET_HUP')
+        self.assertEqual(self.ploader.event.emitted[-1], ('SOCKET_HUP', None))
+
+    @skipIf(selectors is None, 'needs selectors')
+    def test_no_select(self):
+        def fd_out_of_range(*args):
+            raise ValueError('filedescriptor out of range in select()')
+        select_select = net.select.select
+        net.select.select = fd_out_of_range
+        try:
+            self.peer.sendall(encode('PLAY<Keep Alive', {'keep_alive': 1}))
+            self.poll_until(lambda: self.received())
+            self.peer.sendall(encode('PLAY<Keep Alive', {'keep_alive': 2}))
+            self.poll_until(lambda: len(self.received()) == 2)
+        finally:
+            net.select.select = select_select
+        self.assertEqual(self.received(), [1, 2])
+
+    def test_reader_error(self):
+        class BrokenCipher(object):
+            def decrypt_into(self, view, size):
+                raise ValueError('broken')
+        self.plugin.net.cipher = BrokenCipher()
+        self.plugin.net.encrypted = True
+        self.peer.sendall(encode('PLAY<Keep Alive', {'keep_alive': 1}))
+        self.poll_until(lambda: self.ploader.event.emitted)
+        (event, error), = self.ploader.event.emitted
+        self.assertEqual(event, 'SOCKET_ERR')
+        self.assertIsInstance(error, ValueError)
+        self.plugin.reader.join(5)
+        self.assertFalse(self.plugin.reader.is_alive())
+
+    def test_stop(self):
+        reader = self.plugin.reader
+        self.plugin.close_sock()
+        self.assertFalse(reader.is_alive())
+        self.assertIsNone(self.plugin.waker)
+
+    def test_raw_bodies(self):
+        # Split before the reader saw compression turned on
+        net = self.plugin.net
+        net.set_comp_state(0)
+        packet = mcpacket.Packet('PLAY<Keep Alive', {'keep_alive': 7})
+        frame = BoundBuffer(packet.encode(proto.PROTO_COMP_ON, 0))
+        length = datautils.unpack(MC_VARINT, frame)
+        net.read_bodies([(BoundBuffer(frame.read(length)), True)])
+        self.assertEqual(self.received(), [7])
@@ -0,0 +1,133 @@
+from unittest import TestCase
+
+from spockbot.plugins.core.timers import BaseTimer, TimersCore, WorldTick
+
+
+class FakeTime(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TimersCoreTest(TestCase):
+    def setUp(self):
+        from spockbot.plugins.core import timers
+        self.clock = FakeTime()
+        self.real_time = timers.time
+        timers.time = self.clock
+        self.world = WorldTick()
+        self.core = TimersCore(self.world)
+        self.calls = []
+
+    def tearDown(self):
+        from spockbot.plugins.core import timers
+        timers.time = self.real_time
+
+    def callback(self, name):
+        return lambda: self.calls.append(name)
+
+    def test_no_timers(self):
+        self.assertEqual(self.core.get_timeout(), -1)
+        self.core.run_timers()
+        self.assertEqual(self.calls, [])
+
+    def test_event_timers_in_deadline_order(self):
+        self.core.reg_event_timer(3, self.callback('c'), runs=1)
+        self.core.reg_event_timer(1, self.callback('a'), runs=1)
+        self.core.reg_event_timer(2, self.callback('b'), runs=1)
+        self.assertEqual(self.core.get_timeout(), 1)
+        self.clock.now += 2
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertEqual(self.core.get_timeout(), 1)
+        self.clock.now += 5
+        self.assertEqual(self.core.get_timeout(), 0)
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+        self.assertEqual(self.core.get_timeout(), -1)
+
+    def test_repeating_timer(self):
+        self.core.reg_event_timer(1, self.callback('a'), runs=2)
+        for i in range(4):
+            self.clock.now += 1
+            self.core.run_timers()
+        self.assertEqual(self.calls, ['a', 'a'])
+        self.assertEqual(self.core.event_timers, [])
+
+    def test_cancel(self):
+        timer = self.core.reg_event_timer(1, self.callback('a'))
+        self.core.reg_event_timer(5, self.callback('b'))
+        timer.stop()
+        # The stopped timer no longer shortens the timeout
+        self.assertEqual(self.core.get_timeout(), 5)
+        self.clock.now += 5
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['b'])
+
+    def test_reset(self):
+        timer = self.core.reg_event_timer(2, self.callback('a'), runs=1)
+        self.clock.now += 1
+        timer.reset()
+        self.clock.now += 1
+        self.core.run_timers()
+        # Not due at its old deadline, pushed back to the new one
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.core.get_timeout(), 1)
+        self.assertEqual(len(self.core.event_timers), 1)
+        self.clock.now += 1
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(self.core.event_timers, [])
+
+    def test_reregister(self):
+        timer = self.core.reg_tick_timer(1, self.callback('a'), runs=2)
+        self.core.reg_timer(timer)
+        for i in range(3):
+            self.world.age += 1
+            self.core.run_timers()
+        # The first entry is stale, the timer runs once per deadline
+        self.assertEqual(self.calls, ['a', 'a'])
+
+    def test_cancel_compacts(self):
+        timers = [self.core.reg_tick_timer(10, self.callback(i), runs=1)
+                  for i in range(10)]
+        for timer in timers[:6]:
+            timer.cancel()
+        # Rebuilt without waiting for the world age to get there
+        self.assertEqual(len(self.core.tick_timers), 4)
+        self.assertEqual(self.core.cancelled, 0)
+        timers[0].cancel()
+        self.assertEqual(self.core.cancelled, 0)
+        self.world.age = 10
+        self.core.run_timers()
+        self.assertEqual(sorted(self.calls), [6, 7, 8, 9])
+
+    def test_tick_timers(self):
+        self.core.reg_tick_timer(20, self.callback('a'), runs=1)
+        # Tick timers don't bound the wall clock timeout
+        self.assertEqual(self.core.get_timeout(), -1)
+        self.world.age = 19
+        self.core.run_timers()
+        self.assertEqual(self.calls, [])
+        self.world.age = 20
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(self.core.tick_timers, [])
+
+    def test_other_timers_run_every_tick(self):
+        self.core.reg_timer(BaseTimer(self.callback('a'), runs=2))
+        for i in range(3):
+            self.core.run_timers()
+        self.assertEqual(self.calls, ['a', 'a'])
+
+    def test_clear_timers_keeps_persistent(self):
+        self.core.reg_event_timer(1, self.callback('a'))
+        self.core.reg_event_timer(1, self.callback('b'), persist=True)
+        self.core.reg_tick_timer(1, self.callback('c'))
+        self.core.clear_timers()
+        self.clock.now += 1
+        self.world.age += 1
+        self.core.run_timers()
+        self.assertEqual(self.calls, ['b'])
@@ -0,0 +1,213 @@
+import random
+from unittest import TestCase
+
+import pytest
+
+from spockbot.mcp.mcpacket import Packet
+from spockbot.plugins.helpers import entities
+from spockbot.plugins.helpers.entities import (
+    EntitiesPlugin, EntityTable, MobEntity, SpatialIndex, TableEntity
+)
+from spockbot.vector import Vector3
+
+
+class EventMock(object):
+    def __init__(self):
+        self.emitted = []
+        self.handlers = {}
+
+    def emit(self, event, data=None):
+        self.emitted.append((event, data))
+
+    def reg_event_handler(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    def fire(self, event):
+        for handler in self.handlers.get(event, ()):
+            handler(event, None)
+
+
+class PluginLoaderMock(object):
+    def __init__(self):
+        self.event = EventMock()
+
+    def provides(self, ident, obj):
+        pass
+
+    def requires(self, requirement):
+        return self.event
+
+    def reg_event_handler(self, event, handler):
+        self.event.reg_event_handler(event, handler)
+
+
+def spawn_mob(x, y, z, eid):
+    return Packet('PLAY<Spawn Mob', {
+        'eid': eid, 'mob_type': 50, 'x': x, 'y': y, 'z': z,
+        'yaw': 0, 'pitch': 0, 'head_pitch': 0,
+        'velocity_x': 0, 'velocity_y': 0, 'velocity_z': 0,
+    })
+
+
+class EntitiesTest(TestCase):
+    settings = {}
+
+    def setUp(self):
+        self.plugin = EntitiesPlugin(PluginLoaderMock(), self.settings)
+        self.ec = self.plugin.ec
+        self.plugin.handle_spawn_mob(None, spawn_mob(1, 64, 1, 1))
+        self.plugin.handle_spawn_mob(None, spawn_mob(40, 64, 1, 2))
+        self.plugin.handle_spawn_player(None, Packet('PLAY<Spawn Player', {
+            'eid': 3, 'uuid': 0, 'x': 3, 'y': 64, 'z': 0,
+            'yaw': 0, 'pitch': 0, 'current_item': 0,
+        }))
+
+    def eids(self, entities):
+        return [entity.eid for entity in entities]
+
+    def test_within(self):
+        pos = Vector3(0, 64, 0)
+        self.assertEqual(self.eids(self.ec.within(pos, 16)), [1, 3])
+        self.assertEqual(self.eids(self.ec.within(pos, 16, 'mobs')), [1])
+        self.assertEqual(self.eids(self.ec.within(pos, 100)), [1, 3, 2])
+
+    def test_nearest(self):
+        pos = Vector3(45, 64, 0)
+        self.assertEqual(self.eids(self.ec.nearest(None, pos)), [2])
+        self.assertEqual(self.eids(self.ec.nearest('players', pos)), [3])
+        self.assertEqual(self.eids(self.ec.nearest('mobs', pos, 5)), [2, 1])
+
+    def test_moves(self):
+        self.plugin.handle_relative_move(None, Packet(
+            'PLAY<Entity Relative Move',
+            {'eid': 2, 'dx': -38, 'dy': 0, 'dz': 0, 'on_ground': True},
+        ))
+        pos = Vector3(0, 64, 0)
+        self.assertEqual(self.eids(self.ec.within(pos, 2.5)), [1, 2])
+        self.plugin.handle_set_dict(None, Packet('PLAY<Entity Teleport', {
+            'eid': 1, 'x': -100, 'y': 64, 'z': -100,
+            'yaw': 0, 'pitch': 0, 'on_ground': True,
+        }))
+        self.assertEqual(self.eids(self.ec.within(pos, 2.5)), [2])
+        self.plugin.handle_destroy_entities(None, Packet(
+            'PLAY<Destroy Entities', {'eids': [2, 3]}
+        ))
+        self.assertEqual(self.eids(self.ec.within(pos, 1000)), [1])
+        self.assertEqual(list(self.ec.index.cells), [(-7, -7)])
+
+
+class EntityTableTest(EntitiesTest):
+    settings = {'entity_table': True}
+
+    def test_rows(self):
+        table = self.ec.table
+        self.assertIsInstance(self.ec.mobs[1], TableEntity)
+        self.assertEqual(list(table.eids), [1, 2, 3])
+        self.assertEqual(list(table.types), [50, 50, -1])
+        mob = self.ec.mobs[1]
+        self.plugin.handle_destroy_entities(None, Packet(
+            'PLAY<Destroy Entities', {'eids': [1]}
+        ))
+        # The last row took its place, the destroyed mob keeps its state
+        self.assertEqual(list(table.eids), [3, 2])
+        self.assertEqual(table.rows, {3: 0, 2: 1})
+        self.assertEqual((mob.x, mob.y, mob.z), (1, 64, 1))
+        self.assertEqual(self.ec.players[3].x, 3)
+        self.assertEqual(self.ec.mobs[2].x, 40)
+
+    def test_velocity(self):
+        table = self.ec.table
+        table.updated[table.rows[2]] = 100
+        self.plugin.handle_velocity(None, Packet('PLAY<Entity Velocity', {
+            'eid': 2, 'velocity_x': 800, 'velocity_y': 0, 'velocity_z': -400,
+        }))
+        mob = self.ec.mobs[2]
+        now = table.updated[table.rows[2]]
+        self.assertEqual(mob.velocity_x, 800)
+        self.assertEqual(mob.predict(now + 2), (44, 64, -1))
+
+
+def relative_move(eid, dx, dz):
+    return Packet('PLAY<Entity Relative Move', {
+        'eid': eid, 'dx': dx, 'dy': 0, 'dz': dz, 'on_ground': True,
+    })
+
+
+class CoalesceMovesTest(EntitiesTest):
+    settings = {'coalesce_moves': True}
+
+    def test_coalesced_moves(self):
+        event = self.plugin.event
+        event.fire('client_tick')
+        self.plugin.handle_relative_move(None, relative_move(1, 1, 0))
+        self.plugin.handle_relative_move(None, relative_move(2, 1, 0))
+        self.plugin.handle_relative_move(None, relative_move(1, 0.5, 2))
+        self.plugin.handle_relative_move(None, relative_move(3, 1, 1))
+        self.plugin.handle_destroy_entities(None, Packet(
+            'PLAY<Destroy Entities', {'eids': [3]}
+        ))
+        self.assertNotIn('entity_move', [name for name, _ in event.emitted])
+        event.emitted = []
+        # Loop iterations in between client ticks don't flush the batch
+        for _ in range(3):
+            event.fire('event_tick')
+        self.assertEqual(event.emitted, [])
+        event.fire('client_tick')
+        (name, moves), = event.emitted
+        self.assertEqual(name, 'entity_moves')
+        moves = sorted(moves, key=lambda move: move['entity'].eid)
+        self.assertEqual([move['entity'].eid for move in moves], [1, 2])
+        self.assertEqual(moves[0]['old_pos'], [1, 64, 1])
+        self.assertEqual(moves[0]['delta'], [1.5, 0, 2])
+        self.assertEqual(moves[1]['delta'], [1, 0, 0])
+        # Nothing moved since
+        event.fire('client_tick')
+        self.assertEqual(len(event.emitted), 1)
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def predict_mode(request, monkeypatch):
+    if request.param == 'numpy' and entities.numpy is None:
+        pytest.skip('needs numpy')
+    if request.param == 'python':
+        monkeypatch.setattr(entities, 'numpy', None)
+    return request.param
+
+
+def test_predict(predict_mode):
+    table = EntityTable()
+    for eid in range(3):
+        table.add(eid, now=10)
+        table.x[eid] = eid
+        table.velocity_x[eid] = 400 * eid
+        table.velocity_z[eid] = -400
+    table.touch(2, now=11)
+    xs, ys, zs = table.predict(now=12)
+    assert list(xs) == [0, 3, 4]
+    assert list(ys) == [0, 0, 0]
+    assert list(zs) == [-2, -2, -1]
+    assert [list(col) for col in EntityTable().predict()] == [[], [], []]
+
+
+def test_spatial_index_matches_scan():
+    rand = random.Random(1)
+    index = SpatialIndex()
+    entities = {}
+    for eid in range(300):
+        entity = MobEntity()
+        entity.x = rand.uniform(-200, 200)
+        entity.y = rand.uniform(0, 128)
+        entity.z = rand.uniform(-200, 200)
+        entities[eid] = entity
+        index.add(eid, entity)
+    for _ in range(20):
+        pos = [rand.uniform(-250, 250), 64, rand.uniform(-250, 250)]
+        scan = sorted(
+            (sum((a - b) ** 2 for a, b in
+                 zip(pos, (e.x, e.y, e.z))), eid)
+            for eid, e in entities.items()
+        )
+        assert [eid for d, eid, e in index.nearest(pos, 7)] == \
+            [eid for d, eid in scan[:7]]
+        assert sorted(eid for d, eid, e in index.within(pos, 50)) == \
+            sorted(eid for d, eid in scan if d <= 50 * 50)
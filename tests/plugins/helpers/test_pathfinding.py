@@ -0,0 +1,134 @@
+from unittest import TestCase
+
+from spockbot.plugins.helpers.pathfinding import (
+    PathfindingPlugin, find_path_in_snapshot
+)
+from spockbot.plugins.tools.event import EVENT_UNREGISTER
+from spockbot.plugins.tools.smpmap import Dimension
+from spockbot.vector import Vector3
+
+STONE = 1
+
+
+class EventMock(object):
+    def __init__(self):
+        self.handlers = []
+
+    def reg_event_handler(self, event, handler):
+        self.handlers.append((event, handler))
+
+
+class TimersMock(object):
+    def get_timeout(self):
+        return -1
+
+
+class PluginLoaderMock(object):
+    def __init__(self, world):
+        self.world = world
+
+    def reg_event_handler(self, event, handler):
+        pass
+
+    def provides(self, ident, obj):
+        self.provides_ident = ident
+        self.provides_obj = obj
+
+    def requires(self, requirement):
+        if requirement == 'Event':
+            return EventMock()
+        elif requirement == 'World':
+            return self.world
+        elif requirement == 'Timers':
+            return TimersMock()
+        elif requirement in ('Physics', 'ClientInfo'):
+            return True
+        else:
+            raise AssertionError('Unexpected requirement %s' % requirement)
+
+
+class PathfindingTest(TestCase):
+    def setUp(self):
+        self.world = Dimension(0)
+        for x in range(-2, 20):
+            for z in range(-6, 6):
+                self.world.set_block(x, 63, z, STONE, 0)
+                # Fence the area in so the search space is finite
+                if x in (-2, 19) or z in (-6, 5):
+                    for y in (64, 65, 66):
+                        self.world.set_block(x, y, z, STONE, 0)
+        # Wall across z = -3..3 at x = 8, two blocks high
+        for z in range(-3, 4):
+            for y in (64, 65):
+                self.world.set_block(8, y, z, STONE, 0)
+        self.results = []
+        self.start_plugin({})
+
+    def start_plugin(self, settings):
+        ploader = PluginLoaderMock(self.world)
+        self.plug = PathfindingPlugin(ploader, settings)
+        self.pathfind = ploader.provides_obj.pathfind
+
+    def test_path_around_wall(self):
+        self.pathfind(Vector3(0, 64, 0), Vector3(16, 64, 0),
+                      self.results.append)
+        path = self.results[0]
+        self.assertEqual(path[-1].key, (16, 64, 0))
+        self.assertEqual(path[0].key, (0, 64, 0))
+        for node in path:
+            self.assertNotEqual(node.key[0], 8)
+        self.assertIsNone(self.plug.path_job)
+
+    def test_no_valid_path(self):
+        failures = []
+        self.pathfind(Vector3(0, 64, 0), Vector3(16, 80, 0),
+                      self.results.append, failures.append)
+        self.assertEqual(self.results, [])
+        self.assertEqual(failures, [None])
+        self.assertIsNone(self.plug.path_job)
+        self.assertEqual(self.plug.event.handlers, [])
+
+    def test_find_path_in_snapshot(self):
+        sections = self.world.get_snapshot(-2, 60, -6, 19, 70, 5)
+        nodes = find_path_in_snapshot(
+            sections, ((-2, 60, -6), (19, 70, 5)),
+            (0.5, 64, 0.5), (16.5, 64, 0.5),
+        )
+        self.assertEqual(nodes[0], (0.5, 64, 0.5, False, False))
+        self.assertEqual(nodes[-1][:3], (16.5, 64, 0.5))
+        # Target outside of the snapshot bounds
+        self.assertIsNone(find_path_in_snapshot(
+            sections, ((-2, 60, -6), (10, 70, 5)),
+            (0.5, 64, 0.5), (16.5, 64, 0.5),
+        ))
+
+    def test_worker_process(self):
+        self.start_plugin({'worker_processes': 1, 'worker_margin': 4})
+        # Started with the plugin rather than forked mid session
+        self.assertIsNotNone(self.plug.pool)
+        failures = []
+        try:
+            self.pathfind(Vector3(0, 64, 0), Vector3(16, 64, 0),
+                          self.results.append, failures.append)
+            self.assertEqual(self.results, [])
+            (event, handler), = self.plug.event.handlers
+            self.assertEqual(event, 'event_tick')
+            result = self.plug.worker_job[0]
+            # Fails rather than hangs if the pool stops responding
+            result.wait(10)
+            self.assertTrue(result.ready())
+            self.assertEqual(handler(), EVENT_UNREGISTER)
+        finally:
+            workers = list(self.plug.pool._pool)
+            self.plug.handle_kill(None, None)
+        self.assertIsNone(self.plug.pool)
+        self.assertTrue(workers)
+        for worker in workers:
+            self.assertFalse(worker.is_alive())
+        self.assertEqual(failures, [])
+        path = self.results[0]
+        self.assertEqual(path[0].key, (0, 64, 0))
+        self.assertEqual(path[-1].key, (16, 64, 0))
+        for node in path:
+            self.assertNotEqual(node.key[0], 8)
+        self.assertIsNone(self.plug.worker_job)
@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from spockbot.plugins.base import PluginBase
+from spockbot.plugins.core.event import EventPlugin
+from spockbot.plugins.core.timers import TimersPlugin
+from spockbot.plugins.loader import PluginLoader
+from spockbot.plugins.runtime import Runtime
+
+
+class CountdownPlugin(PluginBase):
+    requires = ('Event', 'Timers')
+    defaults = {
+        'runs': 3,
+    }
+    events = {
+        'event_start': 'handle_start',
+    }
+
+    def __init__(self, ploader, settings):
+        super(CountdownPlugin, self).__init__(ploader, settings)
+        self.fired = 0
+        ploader.countdown = self
+
+    def handle_start(self, _, __):
+        self.timers.reg_event_timer(0.001, self.fire,
+                                    runs=self.settings['runs'])
+
+    def fire(self):
+        self.fired += 1
+        if self.fired == self.settings['runs']:
+            self.event.kill()
+
+
+class RuntimeTest(TestCase):
+    def setUp(self):
+        self.runtime = Runtime()
+
+    def make_client(self, runs):
+        return PluginLoader(runtime=self.runtime, plugins=[
+            ('event', EventPlugin),
+            ('timers', TimersPlugin),
+            ('countdown', CountdownPlugin),
+        ], countdown={'runs': runs})
+
+    def test_clients_share_loop(self):
+        clients = [self.make_client(runs) for runs in (2, 5)]
+        for client in clients:
+            self.assertIsNone(client.requires('Event').event_loop())
+        self.runtime.run()
+        self.assertEqual([c.countdown.fired for c in clients], [2, 5])
+        self.assertEqual(self.runtime.event_cores, [])
+        self.assertEqual(self.runtime.timer_cores, [])
+
+    def test_kill(self):
+        client = self.make_client(100)
+        client.requires('Event').event_loop()
+        self.runtime.kill()
+        self.runtime.run()
+        self.assertEqual(client.countdown.fired, 0)
@@ -0,0 +1,45 @@
+from spockbot.mcdata.utils import BoundingBox
+from spockbot.plugins.tools.collision import MTVTest
+from spockbot.plugins.tools.smpmap import Dimension
+from spockbot.vector import Vector3
+
+
+class WorldMock(Dimension):
+    def __init__(self):
+        super(WorldMock, self).__init__(0)
+        self.lookups = 0
+        for x in range(-2, 3):
+            for z in range(-2, 3):
+                self.set_block(x, 63, z, 1, 0)
+        self.set_block(1, 64, 0, 85, 0)  # fence
+
+    def get_block_data(self, x, y, z):
+        self.lookups += 1
+        return super(WorldMock, self).get_block_data(x, y, z)
+
+
+def test_standing_on_ground():
+    col = MTVTest(WorldMock(), BoundingBox(0.6, 1.8))
+    assert not any(col.block_collision(Vector3(-0.3, 64, -0.3)))
+
+
+def test_collision_vectors():
+    col = MTVTest(WorldMock(), BoundingBox(0.6, 1.8))
+    x, y, z = col.block_collision(Vector3(-0.3, 63.75, -0.3))
+    assert x == Vector3(0.3, 0, 0)
+    assert y == Vector3(0, 0.25, 0)
+    assert z == Vector3(0, 0, 0.3)
+    # Fences are 1.5 blocks high
+    x, y, z = col.block_collision(Vector3(0.5, 64.25, 0.2))
+    assert y == Vector3(0, 1.25, 0)
+
+
+def test_box_cache():
+    world = WorldMock()
+    col = MTVTest(world, BoundingBox(0.6, 1.8))
+    boxes = {}
+    col.block_collision(Vector3(-0.3, 64, -0.3), boxes)
+    lookups = world.lookups
+    assert lookups == 27
+    col.check_collision(Vector3(-0.3, 64, -0.3), Vector3(0.1, 0, 0), boxes)
+    assert world.lookups == lookups
@@ -0,0 +1,132 @@
+import pytest
+
+from spockbot.plugins.tools import smpmap
+
+numpy = smpmap.numpy
+needs_numpy = pytest.mark.skipif(numpy is None, reason='needs numpy')
+
+
+def make_dimension(block_data_type):
+    dim = smpmap.Dimension(smpmap.DIMENSION_OVERWOLD, block_data_type)
+    dim.set_block(0, 0, 0, 1, 0)
+    dim.set_block(17, 20, -3, 56, 0)
+    dim.set_block(-1, 255, 15, 54, 2)
+    dim.set_block(5, 70, 5, 56, 1)
+    return dim
+
+
+block_data_types = (
+    smpmap.ChunkDataShort,
+    pytest.param(smpmap.ChunkDataShortNumpy, marks=needs_numpy),
+)
+
+
+@pytest.mark.parametrize('block_data_type', block_data_types)
+def test_get_block(block_data_type):
+    dim = make_dimension(block_data_type)
+    assert dim.get_block(17, 20, -3) == (56, 0)
+    assert dim.get_block(-1, 255, 15) == (54, 2)
+    assert dim.get_block(1, 0, 0) == (0, 0)
+    assert dim.get_block(100, 0, 100) == (0, 0)
+
+
+@needs_numpy
+@pytest.mark.parametrize('block_data_type', block_data_types)
+def test_get_blocks(block_data_type):
+    dim = make_dimension(block_data_type)
+    ids, metas = dim.get_blocks([0, 17, -1, 1, 100, 0],
+                                [0, 20, 255, 0, 0, -1],
+                                [0, -3, 15, 0, 100, 0])
+    assert ids.tolist() == [1, 56, 54, 0, 0, 0]
+    assert metas.tolist() == [0, 0, 2, 0, 0, 0]
+
+
+@needs_numpy
+@pytest.mark.parametrize('block_data_type', block_data_types)
+def test_get_region(block_data_type):
+    dim = make_dimension(block_data_type)
+    ids, metas = dim.get_region(-2, 0, -4, 18, 30, 16)
+    assert ids.shape == (30, 20, 20)
+    assert ids[0 - 0, 0 + 4, 0 + 2] == 1
+    assert ids[20 - 0, -3 + 4, 17 + 2] == 56
+    assert ids.sum() == 1 + 56
+
+
+@needs_numpy
+@pytest.mark.parametrize('block_data_type', block_data_types)
+def test_find_blocks(block_data_type):
+    dim = make_dimension(block_data_type)
+    found = sorted(map(tuple, dim.find_blocks(56).tolist()))
+    assert found == [(5, 70, 5), (17, 20, -3)]
+    assert dim.find_blocks(56, 1).tolist() == [[5, 70, 5]]
+    assert dim.find_blocks(7).shape == (0, 3)
+
+
+@needs_numpy
+def test_numpy_unpack_is_writable():
+    column = smpmap.ChunkColumn(smpmap.ChunkDataShortNumpy)
+    data = numpy.arange(4096, dtype='<u2').tobytes()
+    column.unpack(smpmap.BoundBuffer(data + b'\0' * 4096), 1, False, False)
+    block_data = column.chunks[0].block_data
+    # Owns its memory rather than keeping the packet data alive
+    assert block_data.data.base is None
+    assert block_data.get(1, 0, 0) == 1
+    block_data.set(1, 0, 0, 7 << 4)
+    assert block_data.get(1, 0, 0) == 7 << 4
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def index_mode(request, monkeypatch):
+    if request.param == 'numpy' and numpy is None:
+        pytest.skip('needs numpy')
+    if request.param == 'python':
+        monkeypatch.setattr(smpmap, 'numpy', None)
+    return request.param
+
+
+def test_block_counts(index_mode):
+    dim = make_dimension(smpmap.ChunkDataShort)
+    chunk = dim.get_section(0, 4, 0)
+    assert chunk.get_block_counts() == {0: 4095, 56: 1}
+    dim.set_block(6, 70, 5, 56, 0)
+    dim.set_block(5, 70, 5, 1, 0)
+    assert chunk.get_block_counts() == {0: 4094, 56: 1, 1: 1}
+
+
+def test_nearest_blocks(index_mode):
+    dim = make_dimension(smpmap.ChunkDataShort)
+    assert dim.nearest_blocks(0, 0, 0, 56) == [(17, 20, -3)]
+    assert dim.nearest_blocks(0, 64, 0, 56, 5) == [(5, 70, 5), (17, 20, -3)]
+    assert dim.nearest_blocks(0, 64, 0, (54, 1), 2) == [
+        (0, 0, 0), (-1, 255, 15)]
+    assert dim.nearest_blocks(0, 64, 0, 56, meta=1) == [(5, 70, 5)]
+    assert dim.nearest_blocks(0, 64, 0, 56, 5, max_dist=20) == [(5, 70, 5)]
+    assert dim.nearest_blocks(0, 64, 0, 7) == []
+
+
+def test_nearest_blocks_after_change(index_mode):
+    dim = make_dimension(smpmap.ChunkDataShort)
+    assert dim.nearest_blocks(0, 64, 0, 56) == [(5, 70, 5)]
+    dim.set_block(5, 70, 5, 0, 0)
+    assert dim.nearest_blocks(0, 64, 0, 56) == [(17, 20, -3)]
+
+
+@pytest.mark.parametrize('block_data_type', block_data_types)
+def test_snapshot(block_data_type):
+    dim = make_dimension(block_data_type)
+    sections = dim.get_snapshot(0, 0, -4, 17, 70, 5)
+    assert sorted(sections) == [(0, 0, 0), (0, 4, 0), (1, 1, -1)]
+    copy = smpmap.Dimension(smpmap.DIMENSION_OVERWOLD)
+    copy.load_snapshot(sections)
+    assert copy.get_block(17, 20, -3) == (56, 0)
+    assert copy.get_block(5, 70, 5) == (56, 1)
+    assert copy.get_block(0, 0, 0) == (1, 0)
+    # Outside of the snapshot
+    assert copy.get_block(-1, 255, 15) == (0, 0)
+
+
+def test_get_block_data():
+    dim = make_dimension(smpmap.ChunkDataShort)
+    assert dim.get_block_data(-1, 255, 15) == (54 << 4) | 2
+    assert dim.get_block_data(0, -1, 0) == 0
+    assert dim.get_block_data(0, 256, 0) == 0
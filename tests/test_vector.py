@@ -1,4 +1,5 @@
-from spockbot.vector import CartesianVector
+from spockbot.mcdata.utils import BoundingBox
+from spockbot.vector import CartesianVector, Vector3, YawPitch
 
 
 def test_cartesianvector_add():
@@ -161,3 +162,57 @@ def test_cartesianvector_dist_sq():
     v2 = CartesianVector(0, -2)
     d = v.dist_sq(v2)
     assert d == 1 + 2 * 2
+
+
+def test_vector3_slots():
+    v = Vector3(1, 2, 3)
+    assert not hasattr(v, '__dict__')
+    assert (v.x, v.y, v.z) == (1, 2, 3)
+    assert v.vector == [1, 2, 3]
+    v.vector = (4, 5, 6)
+    v[2] = 7
+    assert list(v) == [4, 5, 7]
+    assert Vector3(v) == Vector3(4, 5, 7)
+    assert Vector3() == Vector3(0, 0, 0)
+
+
+def test_vector3_math():
+    v1 = Vector3(1, 2, 3)
+    v2 = Vector3(0.5, -1, 2)
+    assert v1 + v2 == Vector3(1.5, 1, 5)
+    assert v1 - v2 == Vector3(0.5, 3, 1)
+    assert v1 + (1, 1, 1) == Vector3(2, 3, 4)
+    assert v1 * 2 == 2 * v1 == Vector3(2, 4, 6)
+    assert v1 / 2 == Vector3(0.5, 1, 1.5)
+    assert -v1 == Vector3(-1, -2, -3)
+    assert v2.floor() == Vector3(0, -1, 2)
+    assert v1.dist_sq(v2) == 0.25 + 9 + 1
+    assert v1.dist() == 14 ** 0.5
+    assert v1.dot_product(v2) == 0.5 - 2 + 6
+    assert not Vector3(0, 0, 0)
+    assert hash(v1) == hash(Vector3(1, 2, 3))
+
+    vbackup = v1
+    v1 += v2
+    v1 -= (0.5, 0, 0)
+    v1 *= 2
+    assert v1 is vbackup
+    assert v1 == Vector3(2, 2, 10)
+
+
+def test_vector_slots():
+    # Vector3 keeps its coordinates in x, y and z only
+    for cls in Vector3.__mro__[:-1]:
+        assert 'vector' not in cls.__slots__
+    for v in CartesianVector(1, 2), YawPitch(90, 0):
+        assert not hasattr(v, '__dict__')
+        assert v.vector == list(v)
+
+
+def test_cartesian_vector_classes():
+    v = CartesianVector(1, 2)
+    assert type(v) is CartesianVector
+    assert isinstance(v + v, CartesianVector)
+    assert isinstance(Vector3(1, 2, 3), CartesianVector)
+    assert isinstance(BoundingBox(1, 2), CartesianVector)
+    assert issubclass(Vector3, CartesianVector)